@@ -1,471 +1,147 @@
+import argparse
 import asyncio
-import json
-import websockets
-import signal
 import sys
-import os
 import threading
-import queue
-import socket
+from collections import deque
 from datetime import datetime
-from aiohttp import web
-import tkinter as tk
-from tkinter import ttk
-
-# 全局变量
-latest_heart_rate = None
-connected_clients = set()
+from command_bus import CommandBus
+from discovery import discover, load_last_address
+from filters import add_filter_arguments, filter_options
+from recorder import SessionRecorder
+from rolling import DEFAULT_ZONES, parse_zones
+from service import HeartRateService
+from sources import parse_sources
+
+# tkinter 在 main() 中才导入，--help 等不需要窗口的路径不必加载
+tk = None
+ttk = None
+
+# 心率客户端、推送和网页服务都在 service 中，这里只负责窗口和两个线程之间的通信
+# 日志框本身按帧批量刷新，不按级别过滤
+service = HeartRateService(log=lambda message, level=None: log_message(message),
+                           on_heart_rate=lambda source, value, stats: on_heart_rate(source, value, stats),
+                           on_status=lambda status: update_status(status),
+                           verbose=False)
 is_shutting_down = False
 
 # GUI 全局变量
 gui_root = None
 heart_rate_label = None
+stats_label = None
 ip_entry = None
 status_label = None
 log_text = None
 web_url_label = None
-client = None
-web_runner = None
+settings_entries = {}   # 设置名 -> 输入框
+clients = {}
+client_config = {}      # 运行中修改过的客户端参数，新增的来源也按此设置
+client_tasks = {}
 asyncio_loop = None
-ip_change_queue = None
-
-# 重定向输出到 GUI
+command_bus = None      # Tk 线程与 asyncio 线程之间的命令通道
+
+# 日志先放入队列（deque 的 append/popleft 线程安全），有新日志时通知 Tk 线程，
+# Tk 线程在下一帧把这段时间内的日志批量写入日志框
+LOG_MAX_LINES = 1000    # 日志框最多保留的行数
+LOG_REFRESH_MS = 100    # 日志框刷新间隔（毫秒）
+log_queue = deque(maxlen=10000)
+log_flush_scheduled = False
+
+# 心率显示：asyncio 线程只覆盖最新值并发通知，Tk 线程每帧最多重绘一次
+DISPLAY_FPS = 10        # 心率数字每秒最多重绘次数
+display_value = None    # 最新心率，由 asyncio 线程写入
+display_stats = None    # 最新的窗口统计和区间时间，由 asyncio 线程写入
+rendered_value = None   # 上次绘制的心率
+rendered_stats = None   # 上次绘制的统计
+rendered_color = None   # 上次设置的颜色
+display_refresh_scheduled = False
+
+# 重定向输出到 GUI，可以从任意线程调用
 class TextRedirector:
     def __init__(self, text_widget):
         self.text_widget = text_widget
     
     def write(self, text):
         if self.text_widget and not is_shutting_down and text.strip():
-            try:
-                self.text_widget.insert(tk.END, text)
-                self.text_widget.see(tk.END)
-            except:
-                pass
+            log_queue.append(text if text.endswith("\n") else text + "\n")
+            if command_bus:
+                command_bus.notify('log')
     
     def flush(self):
         pass
 
 
-# 网页 HTML 内容
-HTML_CONTENT = '''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>心率显示</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body, html {
-            width: 100%;
-            height: 100%;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            background: transparent;
-            font-family: Arial, sans-serif;
-        }
-        
-        .container {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            white-space: nowrap;
-        }
-        
-        .heart-icon {
-            display: inline-block;
-            color: #ff4757;
-            font-size: 60px;
-            margin-right: 15px;
-            animation: heartbeat 1.5s infinite;
-            vertical-align: middle;
-        }
-        
-        .heart-rate {
-            display: inline-block;
-            font-size: 80px;
-            font-weight: bold;
-            color: #ff6b81;
-            text-shadow: 0 0 10px rgba(255, 107, 129, 0.7);
-            vertical-align: middle;
-        }
-        
-        @keyframes heartbeat {
-            0% { transform: scale(1); }
-            25% { transform: scale(1.1); }
-            50% { transform: scale(1); }
-            75% { transform: scale(1.1); }
-            100% { transform: scale(1); }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="heart-icon">❤</div>
-        <div class="heart-rate" id="currentRate">--</div>
-    </div>
-    
-    <script>
-        const accessCode = 'XPH5qChgcd';
-        let ws = null;
-        
-        function connectWebSocket() {
-            const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-            const host = window.location.host;
-            
-            ws = new WebSocket(protocol + '//' + host + '/ws');
-            
-            ws.onopen = function() {
-                console.log('WebSocket 已连接');
-                ws.send(JSON.stringify({
-                    type: 'auth',
-                    code: accessCode
-                }));
-            };
-            
-            ws.onmessage = function(event) {
-                try {
-                    const data = JSON.parse(event.data);
-                    console.log('收到消息:', data);
-                    if (data.type === 'heart_rate') {
-                        updateHeartRate(data.current);
-                    }
-                } catch (e) {
-                    console.error('数据解析错误:', e);
-                }
-            };
-            
-            ws.onclose = function() {
-                console.log('WebSocket 已关闭，3 秒后重连');
-                setTimeout(connectWebSocket, 3000);
-            };
-            
-            ws.onerror = function(error) {
-                console.error('WebSocket 错误:', error);
-            };
-        }
-        
-        function updateHeartRate(current) {
-            const rateElement = document.getElementById('currentRate');
-            const heartIcon = document.querySelector('.heart-icon');
-            
-            if (rateElement) {
-                rateElement.textContent = current !== undefined ? current : '--';
-            }
-            
-            if (heartIcon && current !== '--' && current !== null && !isNaN(current)) {
-                const rate = parseInt(current);
-                const duration = Math.max(0.5, 2 - (rate - 60) / 100);
-                heartIcon.style.animationDuration = duration + 's';
-            }
-        }
-        
-        window.addEventListener('load', connectWebSocket);
-    </script>
-</body>
-</html>'''
-
-
-class HeartRateClient:
-    def __init__(self, uri):
-        self.uri = uri
-        self.websocket = None
-        self.reconnect_delay = 5
-        self.heartbeat_interval = 15
-        self.is_running = True
-        self.heartbeat_task = None
-        self.reconnect_requested = False
-        
-    def is_connection_open(self):
-        if self.websocket is None:
-            return False
-        try:
-            return not self.websocket.closed
-        except:
-            return False
-    
-    def request_reconnect(self, new_uri):
-        self.uri = new_uri
-        self.reconnect_requested = True
-        self.is_running = False
-    
-    async def send_heartbeat(self):
-        try:
-            if self.is_connection_open():
-                heartbeat = {
-                    "type": "heartbeat",
-                    "timestamp": datetime.now().isoformat()
-                }
-                await self.websocket.send(json.dumps(heartbeat))
-        except Exception:
-            pass
-    
-    async def heartbeat_loop(self):
-        try:
-            while self.is_running and self.is_connection_open():
-                await asyncio.sleep(self.heartbeat_interval)
-                if self.is_connection_open():
-                    await self.send_heartbeat()
-        except asyncio.CancelledError:
-            pass
-        except Exception:
-            pass
-    
-    async def connect(self):
-        while True:
-            self.is_running = True
-            self.reconnect_requested = False
-            
-            try:
-                log_message(f"[*] 尝试连接：{self.uri}")
-                update_status("连接中...")
-                
-                async with websockets.connect(
-                    self.uri,
-                    ping_interval=20,
-                    ping_timeout=20,
-                    close_timeout=10,
-                    max_size=2**20,
-                    compression=None,
-                ) as websocket:
-                    self.websocket = websocket
-                    log_message(f"[✓] 连接成功！")
-                    update_status("已连接")
-                    
-                    self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
-                    
-                    try:
-                        async for message in websocket:
-                            if self.reconnect_requested:
-                                log_message("[*] 收到重连请求，关闭当前连接")
-                                break
-                            if not self.is_running:
-                                break
-                                
-                            try:
-                                data = json.loads(message)
-                                
-                                if isinstance(data, dict):
-                                    msg_type = data.get('type', 'unknown')
-                                    
-                                    if msg_type == 'heart_rate':
-                                        value = data.get('value')
-                                        log_message(f"  ❤️  心率：{value} {data.get('unit', 'bpm')}")
-                                        await broadcast_heart_rate(value)
-                                    elif msg_type == 'heartbeat':
-                                        pass
-                                    elif msg_type == 'ack':
-                                        pass
-                                elif isinstance(data, (int, float)):
-                                    log_message(f"心率值：{data} bpm")
-                                    await broadcast_heart_rate(data)
-                                else:
-                                    log_message(f"  📝 {message}")
-                                    
-                            except json.JSONDecodeError:
-                                log_message(f"  📝 原始：{message}")
-                                
-                    except websockets.exceptions.ConnectionClosedError:
-                        log_message("[⚠️] 连接断开")
-                        update_status("连接断开")
-                    except websockets.exceptions.ConnectionClosedOK:
-                        log_message("[✓] 连接正常关闭")
-                        update_status("已关闭")
-                    except asyncio.CancelledError:
-                        log_message("[⚠️] 连接被取消")
-                        break
-                    except ConnectionResetError:
-                        log_message("[⚠️] 连接被重置")
-                        update_status("连接重置")
-                    finally:
-                        if self.heartbeat_task and not self.heartbeat_task.done():
-                            self.heartbeat_task.cancel()
-                            try:
-                                await self.heartbeat_task
-                            except asyncio.CancelledError:
-                                pass
-                        self.heartbeat_task = None
-                        self.websocket = None
-                        
-            except websockets.exceptions.InvalidStatus as e:
-                log_message(f"[错误] HTTP 状态码：{e.status_code}")
-                update_status("连接失败")
-            except ConnectionRefusedError:
-                log_message("[错误] 连接被拒绝")
-                update_status("连接被拒绝")
-            except OSError as e:
-                log_message(f"[错误] 网络错误")
-                update_status("网络错误")
-            except asyncio.CancelledError:
-                log_message("[⚠️] 连接任务被取消")
-                break
-            except ConnectionResetError:
-                log_message("[⚠️] 连接被重置")
-                update_status("连接重置")
-            except Exception as e:
-                log_message(f"[错误] {type(e).__name__}")
-                update_status("错误")
-            
-            if self.reconnect_requested:
-                log_message(f"[*] 开始重连到：{self.uri}")
-                self.reconnect_requested = False
-                continue
-                
-            if not self.is_running:
-                break
-            
-            log_message(f"[*] {self.reconnect_delay}秒后重连...")
-            
-            try:
-                for i in range(self.reconnect_delay):
-                    if self.reconnect_requested or not self.is_running:
-                        break
-                    await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                break
-        
-        log_message("[*] 连接循环已结束")
-    
-    def stop(self):
-        self.is_running = False
-        self.reconnect_requested = False
-        log_message("[*] 收到停止信号...")
-
-
-async def broadcast_heart_rate(value):
-    global latest_heart_rate
-    latest_heart_rate = value
-    
-    if gui_root:
-        gui_root.after(0, lambda: update_heart_rate_display(value))
-    
-    message = json.dumps({
-        "type": "heart_rate",
-        "current": value,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    disconnected = set()
-    for ws in connected_clients:
-        try:
-            await ws.send_str(message)
-        except Exception:
-            disconnected.add(ws)
-    
-    connected_clients.difference_update(disconnected)
-
-
-async def handle_websocket(request):
-    ws = web.WebSocketResponse()
-    await ws.prepare(request)
-    
-    connected_clients.add(ws)
-    log_message(f"[🌐] 网页客户端连接，当前连接数：{len(connected_clients)}")
-    
-    if latest_heart_rate is not None:
-        try:
-            await ws.send_str(json.dumps({
-                "type": "heart_rate",
-                "current": latest_heart_rate,
-                "timestamp": datetime.now().isoformat()
-            }))
-        except Exception:
-            pass
-    
-    try:
-        async for msg in ws:
-            if msg.type == web.WSMsgType.TEXT:
-                try:
-                    data = json.loads(msg.data)
-                    if data.get('type') == 'auth':
-                        if data.get('code') == 'XPH5qChgcd':
-                            await ws.send_str(json.dumps({
-                                "type": "auth_result",
-                                "success": True
-                            }))
-                        else:
-                            await ws.send_str(json.dumps({
-                                "type": "auth_result",
-                                "success": False,
-                                "message": "访问码错误"
-                            }))
-                            await ws.close()
-                except json.JSONDecodeError:
-                    pass
-            elif msg.type == web.WSMsgType.ERROR:
-                pass
-    except asyncio.CancelledError:
-        pass
-    except Exception:
-        pass
-    finally:
-        # 优雅关闭 WebSocket 连接
-        try:
-            connected_clients.discard(ws)
-            if not ws.closed:
-                await ws.close(code=1000, message=b'')
-        except Exception:
-            pass
-        if not is_shutting_down:
-            log_message(f"[🌐] 网页客户端断开，当前连接数：{len(connected_clients)}")
-    
-    return ws
-
-
-async def handle_index(request):
-    return web.Response(text=HTML_CONTENT, content_type='text/html')
-
-
-async def start_web_server():
-    global web_runner
-    
-    app = web.Application()
-    app.router.add_get('/', handle_index)
-    app.router.add_get('/ws', handle_websocket)
-    
-    # 配置访问日志，减少错误输出
-    web_runner = web.AppRunner(app, access_log=None)
-    await web_runner.setup()
-    site = web.TCPSite(web_runner, '0.0.0.0', 20888)
-    await site.start()
-    
-    log_message("=" * 50)
-    log_message("🌐 网页服务已启动")
-    log_message("📍 访问地址：http://127.0.0.1:20888")
-    log_message("=" * 50)
-    
-    if web_url_label:
-        gui_root.after(0, lambda: web_url_label.config(text="http://127.0.0.1:20888"))
-    
-    return web_runner
+def on_heart_rate(source, value, stats):
+    """asyncio 线程收到心率时调用；窗口只显示默认来源，由 refresh_heart_rate_display 按帧率重绘"""
+    global display_value, display_stats
+    if source == service.channels.default_id:
+        display_value = value
+        display_stats = stats
+        if command_bus:
+            command_bus.notify('heart_rate')
 
 
 # ==================== GUI 更新函数 ====================
 
 def update_heart_rate_display(value):
-    global heart_rate_label
+    global heart_rate_label, rendered_color
     if heart_rate_label:
         try:
             heart_rate_label.config(text=f"{value} bpm")
             try:
                 val = int(float(value))
                 if val < 60:
-                    heart_rate_label.config(foreground="#2ed573")
+                    color = "#2ed573"
                 elif val > 100:
-                    heart_rate_label.config(foreground="#ff4757")
+                    color = "#ff4757"
                 else:
-                    heart_rate_label.config(foreground="#ff6b81")
+                    color = "#ff6b81"
             except:
-                heart_rate_label.config(foreground="#ff6b81")
+                color = "#ff6b81"
+            if color != rendered_color:
+                heart_rate_label.config(foreground=color)
+                rendered_color = color
         except Exception:
             pass
 
+def schedule_display_refresh():
+    """收到心率通知后在下一帧重绘，保证每秒最多重绘 DISPLAY_FPS 次"""
+    global display_refresh_scheduled
+    if not display_refresh_scheduled and gui_root:
+        display_refresh_scheduled = True
+        gui_root.after(max(1, int(1000 / DISPLAY_FPS)), refresh_heart_rate_display)
+
+def refresh_heart_rate_display():
+    """取最新心率重绘，没有变化则跳过"""
+    global rendered_value, rendered_stats, display_refresh_scheduled
+    display_refresh_scheduled = False
+    value = display_value
+    if value is not None and value != rendered_value:
+        rendered_value = value
+        update_heart_rate_display(value)
+    stats = display_stats
+    if stats is not None and stats != rendered_stats:
+        rendered_stats = stats
+        update_stats_display(stats)
+
+def format_minutes(seconds):
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+def update_stats_display(stats):
+    """在心率下方显示各窗口的最低/平均/最高和各区间的累计时间"""
+    if stats_label:
+        windows = "   ".join(
+            f"{name} {w['min']:g}/{w['mean']:g}/{w['max']:g}"
+            for name, w in stats['windows'].items() if w)
+        zones = "   ".join(
+            f"{name} {format_minutes(seconds)}" for name, seconds in stats['zones'].items())
+        stats_label.config(text=f"最低/平均/最高  {windows}\n区间时间  {zones}")
+
 def update_status(status):
+    """可以从任意线程调用，实际更新由 show_status 在 Tk 线程完成"""
+    if command_bus:
+        command_bus.send_to_gui('status', status)
+
+def show_status(status):
     global status_label
     if status_label:
         try:
@@ -473,33 +149,99 @@ def update_status(status):
         except:
             pass
 
+def show_web_url(url):
+    if web_url_label:
+        web_url_label.config(text=url)
+
 def log_message(message):
-    global log_text
-    if log_text and not is_shutting_down:
+    """写日志，可以从任意线程调用，实际写入由 flush_log_queue 在 Tk 线程完成"""
+    if not is_shutting_down:
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        log_queue.append(f"[{timestamp}] {message}\n")
+        if command_bus:
+            command_bus.notify('log')
+
+def schedule_log_flush():
+    """收到新日志通知后在下一帧批量写入"""
+    global log_flush_scheduled
+    if not log_flush_scheduled and gui_root:
+        log_flush_scheduled = True
+        gui_root.after(LOG_REFRESH_MS, flush_log_queue)
+
+def flush_log_queue():
+    """把队列中的日志一次性写入日志框，并裁剪到 LOG_MAX_LINES 行"""
+    global log_flush_scheduled
+    log_flush_scheduled = False
+    if log_text and log_queue:
+        lines = []
+        for _ in range(len(log_queue)):
+            try:
+                lines.append(log_queue.popleft())
+            except IndexError:
+                break
+        # 超出上限的部分写进去也会马上被裁掉，直接丢弃
+        lines = lines[-LOG_MAX_LINES:]
         try:
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+            log_text.insert(tk.END, "".join(lines))
+            excess = int(log_text.index('end-1c').split('.')[0]) - LOG_MAX_LINES
+            if excess > 0:
+                log_text.delete('1.0', f'{excess + 1}.0')
             log_text.see(tk.END)
-        except:
+        except tk.TclError:
             pass
 
 def on_ip_change():
-    global client, ip_change_queue
-    if ip_entry and client and ip_change_queue is not None:
+    if ip_entry and command_bus:
         new_ip = ip_entry.get().strip()
-        if new_ip:
-            port = 6667
-            new_uri = f"ws://{new_ip}:{port}"
+        sources = parse_sources(new_ip)
+        if sources:
             log_message(f"[*] IP 地址已修改为：{new_ip}")
-            log_message(f"[*] 新目标地址：{new_uri}")
-            ip_change_queue.put(new_uri)
+            for source_id, new_uri in sources:
+                log_message(f"[*] 新目标地址：{new_uri}")
+            command_bus.send_to_loop('sources', sources)
+
+def on_discover():
+    if command_bus:
+        command_bus.send_to_loop('discover')
+
+def show_discovered(addresses):
+    """把搜索到的地址填入输入框并切换过去"""
+    if ip_entry:
+        ip_entry.delete(0, tk.END)
+        ip_entry.insert(0, ", ".join(addresses))
+        on_ip_change()
+
+def on_reconnect():
+    if command_bus:
+        log_message("[*] 手动重连")
+        command_bus.send_to_loop('reconnect')
+
+def on_apply_settings():
+    """界面刷新参数直接生效，连接参数通过命令通道交给 asyncio 线程"""
+    global DISPLAY_FPS, LOG_MAX_LINES
+    try:
+        values = {name: float(entry.get()) for name, entry in settings_entries.items()}
+    except ValueError:
+        log_message("[错误] 设置必须是数字")
+        return
+    DISPLAY_FPS = max(1.0, values['fps'])
+    LOG_MAX_LINES = max(10, int(values['log_lines']))
+    options = {
+        'heartbeat_interval': max(1.0, values['heartbeat_interval']),
+        'reconnect_delay': max(0.1, values['reconnect_delay']),
+    }
+    log_message(f"[*] 设置已更新：心跳 {options['heartbeat_interval']:g} 秒，"
+                f"重连起始等待 {options['reconnect_delay']:g} 秒，"
+                f"刷新 {DISPLAY_FPS:g} 帧/秒，日志 {LOG_MAX_LINES} 行")
+    if command_bus:
+        command_bus.send_to_loop('config', options)
 
 def create_gui():
-    global gui_root, heart_rate_label, ip_entry, status_label, log_text, web_url_label
+    global gui_root, heart_rate_label, stats_label, ip_entry, status_label, log_text, web_url_label
     
     gui_root = tk.Tk()
     gui_root.title("心率监控器")
-    gui_root.geometry("520x420")
+    gui_root.geometry("520x500")
     gui_root.resizable(False, False)
     
     default_font = ("Microsoft YaHei UI", 10)
@@ -519,6 +261,10 @@ def create_gui():
                                  foreground="#ff6b81")
     heart_rate_label.pack()
     
+    stats_label = tk.Label(heart_frame, text="", font=("Microsoft YaHei UI", 9),
+                           foreground="gray", justify=tk.CENTER)
+    stats_label.pack()
+    
     web_frame = ttk.Frame(main_frame)
     web_frame.pack(pady=5)
     
@@ -533,11 +279,36 @@ def create_gui():
     ttk.Label(ip_frame, text="服务器 IP:", font=default_font).pack(side=tk.LEFT, padx=(0, 5))
     ip_entry = ttk.Entry(ip_frame, width=18, font=default_font)
     ip_entry.pack(side=tk.LEFT, padx=(0, 5))
-    ip_entry.insert(0, "192.168.3.168")
+    ip_entry.insert(0, load_last_address() or "192.168.3.168")
     
     update_btn = ttk.Button(ip_frame, text="更新", command=on_ip_change, width=6)
     update_btn.pack(side=tk.LEFT)
     
+    reconnect_btn = ttk.Button(ip_frame, text="重连", command=on_reconnect, width=6)
+    reconnect_btn.pack(side=tk.LEFT, padx=(5, 0))
+    
+    discover_btn = ttk.Button(ip_frame, text="搜索", command=on_discover, width=6)
+    discover_btn.pack(side=tk.LEFT, padx=(5, 0))
+    
+    settings_frame = ttk.Frame(main_frame)
+    settings_frame.pack()
+    
+    settings = (
+        ('heartbeat_interval', "心跳(秒)", 15),
+        ('reconnect_delay', "重连(秒)", 0.5),
+        ('fps', "帧率", DISPLAY_FPS),
+        ('log_lines', "日志行数", LOG_MAX_LINES),
+    )
+    for name, label, value in settings:
+        ttk.Label(settings_frame, text=label, font=default_font).pack(side=tk.LEFT, padx=(5, 2))
+        entry = ttk.Entry(settings_frame, width=5, font=default_font)
+        entry.pack(side=tk.LEFT)
+        entry.insert(0, f"{value:g}")
+        settings_entries[name] = entry
+    
+    apply_btn = ttk.Button(settings_frame, text="应用", command=on_apply_settings, width=6)
+    apply_btn.pack(side=tk.LEFT, padx=(5, 0))
+    
     status_label = tk.Label(main_frame, text="状态：未连接", font=default_font, 
                             foreground="#666666")
     status_label.pack(pady=5)
@@ -560,95 +331,175 @@ def create_gui():
     return gui_root
 
 
-async def run_client_task():
-    global client, asyncio_loop, ip_change_queue
+def apply_sources(sources):
+    """按来源列表增加、重连或停止心率客户端"""
+    show_source = len(sources) > 1
+    wanted = dict(sources)
+    for source_id, client in list(clients.items()):
+        if source_id not in wanted:
+            log_message(f"[*] 移除来源：{source_id}")
+            client.stop()
+            del clients[source_id]
+    for source_id, uri in sources:
+        service.channels.ensure(source_id)
+        client = clients.get(source_id)
+        if client is None:
+            client = clients[source_id] = service.client(uri, source_id, show_source)
+            configure_client(client, client_config)
+            client_tasks[source_id] = asyncio.create_task(client.connect())
+        else:
+            client.prefix = f"[{source_id}] " if show_source else ""
+            if client.uri != uri:
+                log_message(f"[*] 检测到 IP 变更，准备重连到：{uri}")
+                client.request_reconnect(uri)
+
+
+def reconnect_all():
+    """立即重连所有来源"""
+    for client in clients.values():
+        client.request_reconnect(client.uri)
+
+
+def configure_client(client, options):
+    """更新一个客户端的运行参数"""
+    if 'heartbeat_interval' in options:
+        client.heartbeat_interval = options['heartbeat_interval']
+    if 'reconnect_delay' in options:
+        # 作为退避的起始等待时间
+        client.scheduler.base_delay = options['reconnect_delay']
+        client.scheduler.reset()
+
+
+def apply_config(options):
+    """更新各客户端的运行参数，之后新增的来源也使用这些参数"""
+    client_config.update(options)
+    for client in clients.values():
+        configure_client(client, options)
+
+
+def stop_all():
+    """停止所有来源，连接关闭后 run_client_task 随之结束"""
+    for client in clients.values():
+        client.stop()
+
+
+discover_task = None
+
+
+def start_discovery():
+    """在局域网内搜索手机，找到后交给 Tk 线程填入地址"""
+    global discover_task
+    if discover_task and not discover_task.done():
+        return
+    
+    async def run():
+        found = await discover(log=log_message)
+        if found:
+            command_bus.send_to_gui('discovered', found)
+        else:
+            log_message("[搜索] 没有找到手机，请手动输入 IP 地址")
+    
+    discover_task = asyncio.create_task(run())
+
+
+async def run_client_task(args):
     
     ip = ip_entry.get().strip() if ip_entry else "192.168.3.168"
-    port = 6667
-    uri = f"ws://{ip}:{port}"
+    sources = parse_sources(ip) or parse_sources("192.168.3.168")
     
     log_message("=" * 50)
     log_message("WebSocket 心率客户端 + 网页服务")
     log_message("=" * 50)
-    log_message(f"[*] 目标地址：{uri}")
+    for source_id, uri in sources:
+        log_message(f"[*] 目标地址：{uri}" + (f" → /ws?source={source_id}" if len(sources) > 1 else ""))
+        service.channels.ensure(source_id)
     
-    await start_web_server()
+    url = await service.start_web_server('0.0.0.0')
+    log_message("=" * 50)
+    log_message("🌐 网页服务已启动")
+    log_message(f"📍 访问地址：{url}")
+    log_message("=" * 50)
+    command_bus.send_to_gui('web_url', url)
     
-    client = HeartRateClient(uri)
+    if args.record:
+        service.recorder = SessionRecorder(args.record, log=log_message).start()
+        log_message(f"[*] 心率录制到目录：{args.record}")
     
-    asyncio.create_task(check_ip_changes())
+    apply_sources(sources)
     
-    await client.connect()
-
-
-async def check_ip_changes():
-    global client, ip_change_queue
-    
-    while not is_shutting_down:
-        try:
-            try:
-                new_uri = ip_change_queue.get_nowait()
-                if client:
-                    log_message(f"[*] 检测到 IP 变更，准备重连到：{new_uri}")
-                    client.request_reconnect(new_uri)
-            except queue.Empty:
-                pass
-            await asyncio.sleep(0.1)
-        except asyncio.CancelledError:
-            break
-
-
-def check_tasks():
-    if is_shutting_down:
-        gui_root.quit()
-    else:
-        gui_root.after(100, check_tasks)
+    # 等待所有来源的客户端结束，期间可能有来源被增加或移除
+    while client_tasks:
+        done, _ = await asyncio.wait(list(client_tasks.values()),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for source_id, task in list(client_tasks.items()):
+            if task in done:
+                del client_tasks[source_id]
 
 
 def on_closing():
     global is_shutting_down
-    is_shutting_down = True
     log_message("[*] 正在关闭...")
-    if client:
-        client.stop()
-    gui_root.destroy()
+    is_shutting_down = True
+    service.is_shutting_down = True
+    gui_root.withdraw()
+    # 通知 asyncio 线程停止，清理完成后会发回 shutdown；万一没有回应，3 秒后强制退出
+    if not command_bus or not command_bus.send_to_loop('stop'):
+        gui_root.quit()
+    else:
+        gui_root.after(3000, gui_root.quit)
 
 
 async def cleanup():
-    global web_runner, connected_clients
-    
-    # 关闭所有网页客户端连接
-    for ws in list(connected_clients):
-        try:
-            if not ws.closed:
-                await ws.close(code=1000, message=b'')
-        except Exception:
-            pass
-    connected_clients.clear()
-    
-    # 关闭网页服务器
-    if web_runner:
-        try:
-            await web_runner.cleanup()
-        except Exception:
-            pass
-    
+    # 写完录制缓冲区，关闭网页客户端连接和网页服务器
+    await service.close()
     log_message("[*] 程序已退出")
 
 
-def main():
-    global gui_root, asyncio_loop, ip_change_queue
+def parse_args():
+    parser = argparse.ArgumentParser(description="心率监控器")
+    parser.add_argument('--record', metavar='目录', help='把收到的心率录制到指定目录')
+    parser.add_argument('--log-lines', type=int, default=LOG_MAX_LINES, help='日志框最多保留的行数')
+    parser.add_argument('--fps', type=float, default=DISPLAY_FPS, help='心率数字每秒最多重绘次数')
+    parser.add_argument('--zones', type=parse_zones, default=DEFAULT_ZONES, metavar='60,100,140,170',
+                        help='心率区间边界（bpm），推送数据中统计每个区间的累计时间')
+    add_filter_arguments(parser)
+    return parser.parse_args()
+
+
+def main(args):
+    global gui_root, asyncio_loop, command_bus, LOG_MAX_LINES, DISPLAY_FPS, tk, ttk
     
-    ip_change_queue = queue.Queue()
+    LOG_MAX_LINES = max(10, args.log_lines)
+    DISPLAY_FPS = max(1.0, args.fps)
+    service.filters = filter_options(args)
+    service.channels.zones = args.zones
+    
+    import tkinter as tk
+    from tkinter import ttk
     
     create_gui()
     
     asyncio_loop = asyncio.new_event_loop()
     asyncio.set_event_loop(asyncio_loop)
     
+    # 两个线程之间只通过命令通道通信，没有命令时双方都不会被唤醒
+    command_bus = CommandBus(gui_root, asyncio_loop, log=lambda message, level=None: log_message(message))
+    command_bus.on_loop('sources', apply_sources)
+    command_bus.on_loop('reconnect', reconnect_all)
+    command_bus.on_loop('stop', stop_all)
+    command_bus.on_loop('config', apply_config)
+    command_bus.on_loop('discover', start_discovery)
+    command_bus.on_gui('log', schedule_log_flush)
+    command_bus.on_gui('heart_rate', schedule_display_refresh)
+    command_bus.on_gui('status', show_status)
+    command_bus.on_gui('web_url', show_web_url)
+    command_bus.on_gui('discovered', show_discovered)
+    command_bus.on_gui('shutdown', gui_root.quit)
+    command_bus.notify('log')
+    
     def run_asyncio_thread():
         try:
-            asyncio_loop.run_until_complete(run_client_task())
+            asyncio_loop.run_until_complete(run_client_task(args))
         except asyncio.CancelledError:
             pass
         except Exception as e:
@@ -660,12 +511,11 @@ def main():
                 asyncio_loop.run_until_complete(cleanup())
             except:
                 pass
+            command_bus.send_to_gui('shutdown')
     
     asyncio_thread = threading.Thread(target=run_asyncio_thread, daemon=True)
     asyncio_thread.start()
     
-    gui_root.after(100, check_tasks)
-    
     gui_root.protocol("WM_DELETE_WINDOW", on_closing)
     
     gui_root.mainloop()
@@ -678,7 +528,7 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        main(parse_args())
     except KeyboardInterrupt:
         print("\n[*] 强制退出")
     except Exception as e:
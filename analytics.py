@@ -0,0 +1,295 @@
+"""录制会话的离线分析：均值、百分位、区间时间、HRV、心率峰值和 TRIMP
+
+装了 numpy 时，录制文件用 np.frombuffer 直接映射成结构化数组，
+所有统计都是整列的向量运算；没有 numpy 时退回纯 Python 实现，结果相同，只是慢一些。
+numpy 只在分析时才导入，不影响命令行版本的启动速度。
+
+    python 命令行版本.py --analyze 录制目录 [--rest-hr 60 --max-hr 190]
+"""
+import bisect
+import math
+import time
+from datetime import datetime
+
+from console import ERROR, plain_log
+from recorder import HEADER, SessionReader
+from replay import group_by_source
+from rolling import DEFAULT_ZONES, zone_names
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# 两个样本间隔超过这个秒数视为断线，只按这个时长计入区间时间和 TRIMP，与 rolling.ZoneTimer 一致
+MAX_GAP = 5.0
+# RR 间期的有效范围和相邻变化上限，与 filters.RRAnalyzer 一致
+MIN_RR, MAX_RR, MAX_RR_CHANGE = 300, 2000, 0.2
+# 峰值：高于阈值的时段，间隔不到 MERGE_GAP 秒的合并，短于 MIN_PEAK 秒的忽略
+PEAK_PERCENTILE = 90
+MERGE_GAP = 30.0
+MIN_PEAK = 10.0
+# Banister TRIMP 系数 (a, b)
+TRIMP_COEFFICIENTS = {'male': (0.64, 1.92), 'female': (0.86, 1.67)}
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class AnalysisOptions:
+    def __init__(self, zones=DEFAULT_ZONES, rest_hr=60, max_hr=190, sex='male', peak_bpm=None,
+                 hrv_window=30):
+        self.zones = sorted(zones)
+        self.rest_hr = rest_hr
+        self.max_hr = max_hr
+        self.sex = sex
+        self.peak_bpm = peak_bpm  # None 为取本次会话的第 90 百分位
+        self.hrv_window = hrv_window  # 最后这么多个差值的 RMSSD 对应实时推送的值
+
+
+# ---------- numpy 实现 ----------
+
+def load_columns_numpy(np, files):
+    """读取一个来源的全部文件，返回 (时间戳, 心率, RR)：前两列只含样本记录，RR 含续行记录"""
+    dtype = np.dtype([('t', '<f8'), ('hr', '<f4'), ('rr', '<f4')])
+    parts = []
+    for path in files:
+        with SessionReader(path) as reader:
+            view = np.frombuffer(reader.map, dtype, count=reader.count, offset=HEADER.size)
+            # 复制出来后释放对 mmap 的引用，文件才能关闭
+            parts.append(view.copy())
+            del view
+    data = np.concatenate(parts) if parts else np.empty(0, dtype)
+    samples = data[np.isfinite(data['hr'])]
+    return samples['t'], samples['hr'].astype(np.float64), data['rr'].astype(np.float64)
+
+
+def summarize_numpy(np, t, hr, rr, options):
+    dt = np.clip(np.diff(t, append=t[-1]), 0.0, MAX_GAP)
+    summary = {
+        'samples': len(hr),
+        'start': float(t[0]),
+        'duration': float(dt.sum()),
+        'mean': float(hr.mean()),
+        'std': float(hr.std()),
+        'min': float(hr.min()),
+        'max': float(hr.max()),
+        'percentiles': dict(zip(PERCENTILES, np.percentile(hr, PERCENTILES).tolist())),
+    }
+
+    names = zone_names(options.zones)
+    zone_index = np.searchsorted(np.asarray(options.zones, dtype=np.float64), hr, side='right')
+    seconds = np.bincount(zone_index, weights=dt, minlength=len(names))
+    summary['zones'] = dict(zip(names, seconds.tolist()))
+
+    rr = rr[np.isfinite(rr) & (rr >= MIN_RR) & (rr <= MAX_RR)]
+    summary['hrv'] = None
+    if len(rr) >= 2:
+        diffs = np.diff(rr)
+        diffs = diffs[np.abs(diffs) <= MAX_RR_CHANGE * rr[:-1]]
+        if len(diffs):
+            summary['hrv'] = {
+                'count': len(rr),
+                'mean_rr': float(rr.mean()),
+                'sdnn': float(rr.std(ddof=1)),
+                'rmssd': float(np.sqrt(np.mean(diffs ** 2))),
+                'rmssd_recent': float(np.sqrt(np.mean(diffs[-options.hrv_window:] ** 2))),
+                'pnn50': float(np.mean(np.abs(diffs) > 50) * 100),
+            }
+
+    threshold = options.peak_bpm or float(np.percentile(hr, PEAK_PERCENTILE))
+    padded = np.concatenate(([False], hr >= threshold, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    segments = list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+    summary['peaks'] = find_peaks(segments, t, hr, threshold, lambda s, e: int(np.argmax(hr[s:e])) + s)
+
+    a, b = TRIMP_COEFFICIENTS[options.sex]
+    ratio = np.clip((hr - options.rest_hr) / (options.max_hr - options.rest_hr), 0.0, 1.0)
+    summary['trimp'] = float(np.sum(dt / 60 * ratio * a * np.exp(b * ratio)))
+    return summary
+
+
+# ---------- 纯 Python 实现 ----------
+
+def load_columns_python(files):
+    records = []
+    for path in files:
+        with SessionReader(path) as reader:
+            records.extend(reader.iter_records())
+    if not records:
+        return [], [], []
+    samples = [record for record in records if not math.isnan(record[1])]
+    return [r[0] for r in samples], [r[1] for r in samples], [r[2] for r in records]
+
+
+def percentile(ordered, q):
+    """线性插值的百分位，与 numpy.percentile 默认方法相同"""
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize_python(t, hr, rr, options):
+    n = len(hr)
+    dt = [min(MAX_GAP, max(0.0, t[i + 1] - t[i])) for i in range(n - 1)] + [0.0]
+    mean = sum(hr) / n
+    ordered = sorted(hr)
+    summary = {
+        'samples': n,
+        'start': t[0],
+        'duration': sum(dt),
+        'mean': mean,
+        'std': math.sqrt(sum((v - mean) ** 2 for v in hr) / n),
+        'min': ordered[0],
+        'max': ordered[-1],
+        'percentiles': {q: percentile(ordered, q) for q in PERCENTILES},
+    }
+
+    names = zone_names(options.zones)
+    seconds = [0.0] * len(names)
+    for value, step in zip(hr, dt):
+        seconds[bisect.bisect_right(options.zones, value)] += step
+    summary['zones'] = dict(zip(names, seconds))
+
+    rr = [x for x in rr if MIN_RR <= x <= MAX_RR]  # NaN 不满足比较，一并排除
+    diffs = [b - a for a, b in zip(rr, rr[1:]) if abs(b - a) <= MAX_RR_CHANGE * a]
+    summary['hrv'] = None
+    if diffs:
+        recent = diffs[-options.hrv_window:]
+        mean_rr = sum(rr) / len(rr)
+        summary['hrv'] = {
+            'count': len(rr),
+            'mean_rr': mean_rr,
+            'sdnn': math.sqrt(sum((x - mean_rr) ** 2 for x in rr) / (len(rr) - 1)),
+            'rmssd': math.sqrt(sum(d * d for d in diffs) / len(diffs)),
+            'rmssd_recent': math.sqrt(sum(d * d for d in recent) / len(recent)),
+            'pnn50': sum(abs(d) > 50 for d in diffs) / len(diffs) * 100,
+        }
+
+    threshold = options.peak_bpm or percentile(ordered, PEAK_PERCENTILE)
+    segments = []
+    start = None
+    for i, value in enumerate(hr):
+        if value >= threshold and start is None:
+            start = i
+        elif value < threshold and start is not None:
+            segments.append((start, i))
+            start = None
+    if start is not None:
+        segments.append((start, n))
+    summary['peaks'] = find_peaks(segments, t, hr, threshold,
+                                  lambda s, e: max(range(s, e), key=hr.__getitem__))
+
+    a, b = TRIMP_COEFFICIENTS[options.sex]
+    span = options.max_hr - options.rest_hr
+    trimp = 0.0
+    for value, step in zip(hr, dt):
+        ratio = min(1.0, max(0.0, (value - options.rest_hr) / span))
+        trimp += step / 60 * ratio * a * math.exp(b * ratio)
+    summary['trimp'] = trimp
+    return summary
+
+
+# ---------- 共用部分 ----------
+
+def find_peaks(segments, t, hr, threshold, argmax):
+    """合并相邻的高心率时段，返回阈值和各峰值 (最高心率时刻, 最高心率, 持续秒数)"""
+    merged = []
+    for start, end in segments:
+        if merged and t[start] - t[merged[-1][1] - 1] < MERGE_GAP:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    peaks = []
+    for start, end in merged:
+        duration = t[end - 1] - t[start]
+        if duration >= MIN_PEAK:
+            top = argmax(start, end)
+            peaks.append((float(t[top]), float(hr[top]), float(duration)))
+    return {'threshold': float(threshold), 'items': peaks}
+
+
+def analyze(paths, options, log=plain_log):
+    """分析录制文件或目录，按来源输出报告，返回 {来源: 统计}"""
+    groups = group_by_source(paths)
+    if not groups:
+        log("[错误] 没有找到录制文件", ERROR)
+        return {}
+    started = time.perf_counter()
+    np = load_numpy()
+    results = {}
+    total = 0
+    for source, files in groups.items():
+        if np is not None:
+            t, hr, rr = load_columns_numpy(np, files)
+        else:
+            t, hr, rr = load_columns_python(files)
+        if len(hr) == 0:
+            continue
+        total += len(hr)
+        if np is not None:
+            results[source] = summarize_numpy(np, t, hr, rr, options)
+        else:
+            results[source] = summarize_python(t, hr, rr, options)
+    elapsed = time.perf_counter() - started
+
+    for source, summary in results.items():
+        log("")
+        for line in format_report(source, len(groups[source]), summary):
+            log(line)
+    backend = "numpy" if np is not None else "纯 Python，安装 numpy 可加速"
+    log(f"\n[分析] {len(results)} 个来源，{total} 个样本，用时 {elapsed:.3f} 秒（{backend}）")
+    return results
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def format_report(source, file_count, s):
+    def clock(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')
+
+    lines = [
+        f"来源 {source}：{file_count} 个文件，{datetime.fromtimestamp(s['start']):%Y-%m-%d %H:%M} 开始，"
+        f"有效时长 {format_duration(s['duration'])}，{s['samples']} 个样本",
+        f"  心率    平均 {s['mean']:.1f}  标准差 {s['std']:.1f}  最低 {s['min']:g}  最高 {s['max']:g}",
+        "  百分位  " + "  ".join(f"p{q} {v:.0f}" for q, v in s['percentiles'].items()),
+    ]
+    duration = s['duration'] or 1.0
+    lines.append("  区间    " + "  ".join(
+        f"{name} {format_duration(seconds)} ({seconds / duration:.0%})"
+        for name, seconds in s['zones'].items()))
+    hrv = s['hrv']
+    if hrv:
+        lines.append(f"  HRV     RR {hrv['count']} 个  平均 RR {hrv['mean_rr']:.0f} ms  "
+                     f"SDNN {hrv['sdnn']:.1f}  RMSSD {hrv['rmssd']:.1f}  pNN50 {hrv['pnn50']:.1f}%  "
+                     f"结束时 RMSSD {hrv['rmssd_recent']:.1f}")
+    else:
+        lines.append("  HRV     无 RR 间期数据")
+    peaks = s['peaks']
+    top = sorted(peaks['items'], key=lambda peak: peak[1], reverse=True)[:3]
+    shown = "；".join(f"{clock(at)} {bpm:g} bpm 持续 {format_duration(seconds)}" for at, bpm, seconds in top)
+    lines.append(f"  峰值    {len(peaks['items'])} 次（>= {peaks['threshold']:.0f} bpm）" + (f"：{shown}" if shown else ""))
+    lines.append(f"  TRIMP   {s['trimp']:.1f}")
+    return lines
+
+
+def add_analysis_arguments(parser):
+    group = parser.add_argument_group('离线分析')
+    group.add_argument('--analyze', metavar='路径', nargs='+',
+                       help='分析录制文件或目录并输出报告，不连接手机')
+    group.add_argument('--rest-hr', type=float, default=60, help='静息心率，用于 TRIMP')
+    group.add_argument('--max-hr', type=float, default=190, help='最大心率，用于 TRIMP')
+    group.add_argument('--female', action='store_true', help='TRIMP 使用女性系数')
+    group.add_argument('--peak-bpm', type=float, help='峰值阈值，默认取第 90 百分位')
+
+
+def analysis_options(args):
+    return AnalysisOptions(zones=args.zones, rest_hr=args.rest_hr,
+                           max_hr=max(args.max_hr, args.rest_hr + 1),
+                           sex='female' if args.female else 'male', peak_bpm=args.peak_bpm,
+                           hrv_window=max(1, args.hrv_window))
@@ -0,0 +1,80 @@
+"""上游重连调度：去相关抖动退避、可随时唤醒的等待、恢复用时统计
+
+退避采用 decorrelated jitter：下一次等待在 [base, 上一次 × 3] 之间随机取，
+再截到 cap，多个客户端不会同时重试。等待期间：
+    - wake() 立即结束等待（停止、改 IP、手动重连时调用）
+    - 定期用很短的超时探测上游端口，网络一恢复就马上重试；
+      每次中断只提前一次，之后仍失败说明问题不在网络，按完整的退避等待
+"""
+import asyncio
+import random
+import time
+
+import metrics
+
+
+class ReconnectScheduler:
+    def __init__(self, base_delay=0.5, max_delay=60, connect_timeout=5,
+                 probe_interval=1.0, source=None, rng=None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout  # 与 ping 超时分开设置，握手失败能更快发现
+        self.probe_interval = probe_interval
+        self.source = source
+        self.rng = rng or random.Random()
+        self.delay = base_delay
+        self.down_since = None
+        self.last_recovery = None
+        self.probe_fired = False  # 本次中断中探测是否已提前结束过等待
+        self._wakeup = asyncio.Event()
+
+    def next_delay(self):
+        """计算下一次重连前的等待时间"""
+        self.delay = min(self.max_delay, self.rng.uniform(self.base_delay, self.delay * 3))
+        return self.delay
+
+    def reset(self):
+        self.delay = self.base_delay
+
+    def wake(self):
+        """立即结束当前等待"""
+        self._wakeup.set()
+
+    async def wait(self, delay, probe=None):
+        """等待 delay 秒；被唤醒或 probe() 返回真时提前结束，返回是否提前结束"""
+        self._wakeup.clear()
+        if self.probe_fired:
+            probe = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            step = min(remaining, self.probe_interval) if probe else remaining
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), step)
+                return True
+            except asyncio.TimeoutError:
+                pass
+            if probe and loop.time() < deadline and await probe():
+                self.probe_fired = True
+                return True
+
+    def mark_down(self):
+        """记录连接中断的时间点"""
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+
+    def mark_up(self):
+        """连接恢复，返回从中断到恢复的秒数（之前没有中断则返回 None）"""
+        self.reset()
+        self.probe_fired = False
+        if self.down_since is None:
+            return None
+        recovered = time.monotonic() - self.down_since
+        self.down_since = None
+        self.last_recovery = recovered
+        metrics.RECOVERY_SECONDS.observe(recovered)
+        metrics.LAST_RECOVERY_SECONDS.labels(self.source).set(recovered)
+        return recovered
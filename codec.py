@@ -0,0 +1,115 @@
+"""上游消息解码和推送帧编码
+
+解码：
+    纯数字帧（如 "72"）按 JSON 数字语法校验后直接用 int()/float() 转换，结果与 JSON 库相同：
+    整数得到 int，带小数点或指数的得到 float，前导零等 JSON 不接受的写法仍交给 JSON 库报错
+    其余帧用可用的最快 JSON 库解析：orjson > ujson > 标准库 json，
+    可用环境变量 HEARTRATE_JSON=json 等强制指定
+编码：
+    心率、心跳帧按固定模板拼接，只有附加字段（RR、统计）交给 JSON 库；
+    时间戳的“年-月-日T时:分:秒”部分每秒只格式化一次
+"""
+import math
+import os
+import re
+import time
+from datetime import datetime
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def select_backend(name=None):
+    """返回 (名称, loads, dumps)，dumps 统一返回 str；指定的库不可用时按优先级回退"""
+    names = BACKENDS if not name else (name,) + BACKENDS
+    for candidate in names:
+        try:
+            if candidate == 'orjson':
+                import orjson
+                return 'orjson', orjson.loads, lambda obj: orjson.dumps(obj).decode()
+            if candidate == 'ujson':
+                import ujson
+                return 'ujson', ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False)
+            if candidate == 'json':
+                import json
+                return 'json', json.loads, json.dumps
+        except ImportError:
+            continue
+    raise ValueError(f"未知的 JSON 库：{name}")
+
+
+BACKEND, loads, dumps = select_backend(os.environ.get('HEARTRATE_JSON'))
+
+_NUMERIC_START = frozenset('0123456789-')
+_NUMERIC_START_BYTES = frozenset(b'0123456789-')
+# JSON 数字语法，允许末尾空白；分组 1、2 为小数和指数部分，都没有匹配时是整数
+_NUMBER_PATTERN = r'-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?[ \t\n\r]*\Z'
+_NUMBER = re.compile(_NUMBER_PATTERN)
+_NUMBER_BYTES = re.compile(_NUMBER_PATTERN.encode())
+
+
+def make_decoder(loads):
+    """生成解码函数：纯数字帧走快速路径，其余交给 loads，解析失败抛出 ValueError"""
+    def decode(message):
+        if message:
+            first = message[0]
+            if first in _NUMERIC_START:
+                match = _NUMBER.match(message)
+            elif first in _NUMERIC_START_BYTES:
+                match = _NUMBER_BYTES.match(message)
+            else:
+                match = None
+            if match is not None:
+                if match.lastindex is None:
+                    return int(message)
+                number = float(message)
+                # 超出 float 范围的交给 JSON 库，按各库自己的方式处理
+                if math.isfinite(number):
+                    return number
+        return loads(message)
+    return decode
+
+
+decode_frame = make_decoder(loads)
+
+
+class _Clock:
+    """ISO 格式的本地时间戳，秒以上部分按秒缓存"""
+
+    def __init__(self):
+        self.second = None
+        self.prefix = ''
+
+    def isoformat(self):
+        now = time.time()
+        second = int(now)
+        if second != self.second:
+            self.second = second
+            self.prefix = datetime.fromtimestamp(second).strftime('%Y-%m-%dT%H:%M:%S')
+        return f"{self.prefix}.{int((now - second) * 1e6):06d}"
+
+
+timestamp = _Clock().isoformat
+
+
+def encode_value(value, dumps=dumps):
+    """心率值的 JSON 表示；int/float 的 repr 与 JSON 相同，不必调用 JSON 库"""
+    if type(value) is int or (type(value) is float and math.isfinite(value)):
+        return repr(value)
+    return dumps(value)
+
+
+def heart_rate_frame(value, extra=None, dumps=dumps):
+    """推送给网页的心率帧，extra 中的字段依次附加在 timestamp 之后"""
+    head = f'{{"type": "heart_rate", "current": {encode_value(value, dumps)}, "timestamp": "{timestamp()}"'
+    if extra:
+        # dumps(extra) 形如 {"rr": [...]}，去掉开头的 { 接在模板后面
+        return f"{head}, {dumps(extra)[1:]}"
+    return head + '}'
+
+
+def heartbeat_frame():
+    return f'{{"type": "heartbeat", "timestamp": "{timestamp()}"}}'
+
+
+AUTH_OK = '{"type": "auth_result", "success": true}'
+AUTH_FAILED = dumps({"type": "auth_result", "success": False, "message": "访问码错误"})
@@ -0,0 +1,102 @@
+"""Tk 线程与 asyncio 线程之间的双向命令通道
+
+两边都只在有命令时被唤醒，没有定时轮询：
+    Tk → asyncio：loop.call_soon_threadsafe 直接唤醒事件循环
+    asyncio → Tk：命令放入队列后生成一个 <<CommandBus>> 虚拟事件，
+                  Tk 主循环处理事件时一次取完队列中的所有命令
+
+notify() 用于不带参数的"有新数据"通知，同名通知在被处理前只会保留一个。
+"""
+from collections import deque
+
+from console import ERROR, plain_log
+
+GUI_EVENT = '<<CommandBus>>'
+
+
+class CommandBus:
+    def __init__(self, root, loop, log=plain_log):
+        self.root = root
+        self.loop = loop
+        self.log = log
+        self.loop_handlers = {}
+        self.gui_handlers = {}
+        self._gui_queue = deque()
+        self._notified = {}
+        self._gui_pending = False
+        self.closed = False
+        root.bind(GUI_EVENT, self._drain_gui)
+
+    # ---------- Tk → asyncio ----------
+
+    def on_loop(self, command, handler):
+        """登记在 asyncio 线程执行的命令处理函数"""
+        self.loop_handlers[command] = handler
+
+    def send_to_loop(self, command, *args):
+        """从任意线程发送命令给 asyncio 线程"""
+        if self.closed or self.loop.is_closed():
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self._dispatch_loop, command, args)
+        except RuntimeError:
+            # 事件循环已经关闭
+            return False
+        return True
+
+    def _dispatch_loop(self, command, args):
+        handler = self.loop_handlers.get(command)
+        if handler:
+            handler(*args)
+
+    # ---------- asyncio → Tk ----------
+
+    def on_gui(self, command, handler):
+        """登记在 Tk 线程执行的命令处理函数"""
+        self.gui_handlers[command] = handler
+
+    def send_to_gui(self, command, *args):
+        """从任意线程发送命令给 Tk 线程，命令按顺序逐条处理"""
+        if self.closed:
+            return
+        self._gui_queue.append((command, args))
+        self._wake_gui()
+
+    def notify(self, command):
+        """通知 Tk 线程有新数据，未处理的同名通知会合并"""
+        if self.closed or self._notified.get(command):
+            return
+        self._notified[command] = True
+        self._gui_queue.append((command, None))
+        self._wake_gui()
+
+    def _wake_gui(self):
+        if self._gui_pending:
+            return
+        self._gui_pending = True
+        try:
+            self.root.event_generate(GUI_EVENT, when='tail')
+        except Exception:
+            # 窗口已经销毁
+            self._gui_pending = False
+
+    def _drain_gui(self, event=None):
+        # 先清标志再取队列，取的过程中新来的命令会再生成一个事件，不会漏掉
+        self._gui_pending = False
+        for _ in range(len(self._gui_queue)):
+            try:
+                command, args = self._gui_queue.popleft()
+            except IndexError:
+                break
+            if args is None:
+                self._notified[command] = False
+                args = ()
+            handler = self.gui_handlers.get(command)
+            if handler:
+                try:
+                    handler(*args)
+                except Exception as e:
+                    self.log(f"[命令] {command} 处理失败：{e}", ERROR)
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,157 @@
+"""命令行版本的控制台日志：后台线程写出，逐条心率合并为状态行
+
+慢速的 Windows 控制台或被管道接收的 stdout 上，print 可能阻塞几十毫秒，
+直接在事件循环里打印会拖慢上游读取和网页推送。这里：
+    log(message, level)  只把一行放进有界队列，满了丢弃最旧的并计数，从不阻塞
+    sample(source, value)  只更新最新心率和计数，由写线程定期汇总
+写线程有新日志时立即写出，并每隔 status_interval 秒输出一次状态：
+终端中是原地刷新的一行，被重定向时是一行汇总（这段时间没有心率则不输出）。
+"""
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+
+
+def plain_log(message, level=INFO):
+    """不经过队列直接打印，HeartRateService 等的默认日志函数"""
+    print(message)
+
+
+class ConsoleLogger:
+    """可直接作为 log 回调使用：logger(message) 或 logger(message, WARNING)"""
+
+    def __init__(self, level=INFO, stream=None, status_interval=1.0, max_pending=10000, status=None):
+        self.level = level
+        self.stream = stream or sys.stdout
+        self.status_interval = status_interval
+        self.status = status  # 返回附加状态文字的函数，在写线程中调用，只应读取现成的简单值
+        self.pending = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.latest = {}  # 来源 -> 最新心率
+        self.samples = 0
+        self.interactive = self.stream.isatty()
+        self.status_width = 0  # 终端中当前状态行的宽度，写日志前先擦掉
+        self.wakeup = threading.Event()
+        self.drained = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def __call__(self, message, level=INFO):
+        if level < self.level:
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(message)
+        self.wakeup.set()
+
+    def sample(self, source, value):
+        self.latest[source] = value
+        self.samples += 1
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='console-writer', daemon=True)
+            self.thread.start()
+        return self
+
+    def flush(self, timeout=1.0):
+        """等待写线程写完队列中的日志，input() 提示前调用，避免日志插在提示中间"""
+        if self.thread is None or not self.pending:
+            return
+        self.drained.clear()
+        self.wakeup.set()
+        self.drained.wait(timeout)
+
+    def close(self, timeout=2.0):
+        """写完剩余日志并停止写线程；写线程未启动时直接写出"""
+        if self.thread is None:
+            try:
+                self._write_pending()
+            except (OSError, ValueError):
+                pass
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        last_status = time.monotonic()
+        last_samples = 0
+        while not self.stopping:
+            # status_interval 为 0 时不输出状态，只在有日志时醒来
+            self.wakeup.wait(self.status_interval or None)
+            self.wakeup.clear()
+            try:
+                self._write_pending()
+                now = time.monotonic()
+                if self.status_interval and now - last_status >= self.status_interval:
+                    samples = self.samples
+                    self._write_status((samples - last_samples) / (now - last_status))
+                    last_status, last_samples = now, samples
+                if self.stopping:
+                    self._clear_status()
+            except (OSError, ValueError):
+                # 控制台已关闭，丢弃日志但不影响程序
+                self.pending.clear()
+            except Exception as e:
+                # 写线程退出后之后的日志会全部丢失，意外错误只记一行
+                self.pending.append(f"[日志] 写出失败：{type(e).__name__}: {e}")
+            self.drained.set()
+
+    def _write_pending(self):
+        if not self.pending:
+            return
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        if self.dropped:
+            lines.append(f"[日志] 输出过慢，丢弃了 {self.dropped} 行")
+            self.dropped = 0
+        self._clear_status()
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+
+    def _clear_status(self):
+        if self.status_width:
+            self.stream.write("\r" + " " * self.status_width + "\r")
+            self.stream.flush()
+            self.status_width = 0
+
+    def _write_status(self, rate):
+        if not rate and not self.interactive:
+            return
+        latest = dict(self.latest)  # 事件循环线程可能同时加入新来源
+        if not latest:
+            return
+        if len(latest) == 1:
+            shown = f"{next(iter(latest.values()))} bpm"
+        else:
+            shown = "  ".join(f"{source}:{value}" for source, value in latest.items())
+        text = f"❤️  {shown}  {rate:.1f} 条/秒"
+        if self.status:
+            try:
+                text += f"  {self.status()}"
+            except Exception:
+                # 附加状态取不到时只显示心率
+                pass
+        if self.interactive:
+            # 直接覆盖上一次的状态行，新的较短时用空格补齐，不先擦除以免闪烁
+            width = display_width(text)
+            self.stream.write("\r" + text + " " * max(0, self.status_width - width))
+            self.status_width = max(width, self.status_width)
+        else:
+            self.stream.write(f"[状态] {text}\n")
+        self.stream.flush()
+
+
+def display_width(text):
+    """终端显示宽度，中文和表情按两列计算"""
+    return sum(2 if ord(char) > 0x1100 else 1 for char in text)
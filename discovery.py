@@ -0,0 +1,112 @@
+"""局域网内自动查找手机心率服务（端口 6667）
+
+先探测上次成功连接的地址，不通再并发扫描本机所在的 /24 网段：
+用信号量限制同时进行的 TCP 连接数，每个地址只给很短的超时，
+端口开放的主机再做一次 WebSocket 握手确认。整段扫描约一秒。
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+
+from console import WARNING, plain_log
+
+DEFAULT_PORT = 6667
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.heart_rate_monitor.json')
+
+
+def load_last_address(path=CACHE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('last_address')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def remember_address(address, path=CACHE_PATH):
+    """记录最近一次可用的地址，下次启动优先探测"""
+    if not address or address == load_last_address(path):
+        return
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'last_address': address}, f)
+    except OSError:
+        pass
+
+
+def local_ipv4():
+    """本机用于访问局域网的 IPv4 地址（UDP connect 不会真的发包）"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(('192.168.255.255', 1))
+            return s.getsockname()[0]
+        except OSError:
+            return None
+
+
+def subnet_hosts(address, prefix=24):
+    network = ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+    return [str(host) for host in network.hosts() if str(host) != address]
+
+
+async def port_open(host, port, timeout):
+    """TCP 端口能否在 timeout 秒内连上"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def probe(host, port=DEFAULT_PORT, timeout=0.6):
+    """确认 host:port 上是 WebSocket 服务"""
+    if not await port_open(host, port, timeout):
+        return False
+    import websockets
+
+    try:
+        websocket = await asyncio.wait_for(
+            websockets.connect(f"ws://{host}:{port}", compression=None), timeout * 2)
+    except Exception:
+        return False
+    await websocket.close()
+    return True
+
+
+async def scan(hosts, port=DEFAULT_PORT, timeout=0.6, concurrency=256):
+    """并发扫描，返回所有可用的主机"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(host):
+        async with semaphore:
+            return host if await probe(host, port, timeout) else None
+
+    results = await asyncio.gather(*(check(host) for host in hosts))
+    return [host for host in results if host]
+
+
+async def discover(port=DEFAULT_PORT, timeout=0.6, concurrency=256, log=plain_log):
+    """返回找到的手机地址列表，上次可用的地址排在最前"""
+    last = load_last_address()
+    if last and await probe(last, port, timeout):
+        log(f"[搜索] 上次的地址仍然可用：{last}")
+        return [last]
+
+    address = local_ipv4()
+    if not address:
+        log("[搜索] 无法确定本机局域网地址", WARNING)
+        return []
+    log(f"[搜索] 正在扫描 {address}/24 的 {port} 端口...")
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    found = await scan(subnet_hosts(address), port, timeout, concurrency)
+    log(f"[搜索] 用时 {loop.time() - started:.1f} 秒，找到 {len(found)} 个：{', '.join(found) or '无'}")
+    if found:
+        remember_address(found[0])
+    return found
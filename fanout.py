@@ -0,0 +1,346 @@
+"""网页客户端推送：每个观众一个独立的有界发送队列和写任务
+
+广播方只把消息放进各观众的队列就返回，不等待任何网络发送，
+因此一个卡住的 OBS 浏览器源不会拖慢其他观众和上游读取。
+
+每个心率样本只序列化一次（Sample），WebSocket、SSE 和 /api/latest
+共用同一份 JSON，各自需要的字节形式在第一次用到时生成并缓存。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+import metrics
+from console import WARNING, plain_log
+from history import HistoryRing
+from rolling import DEFAULT_ZONES, RollingStats
+
+# 进程启动标识，放进 ETag 和 SSE 事件 id，程序重启后旧的 ETag 不会误命中
+BOOT_ID = os.urandom(4).hex()
+
+
+class Sample:
+    """一个心率样本的预编码形式，所有观众共用"""
+
+    __slots__ = ('sequence', 'value', 'text', '_body', '_sse')
+
+    def __init__(self, sequence, value, text):
+        self.sequence = sequence
+        self.value = value
+        self.text = text  # WebSocket 直接发送的 JSON 文本
+        self._body = None
+        self._sse = None
+
+    @property
+    def body(self):
+        """/api/latest 的响应体"""
+        if self._body is None:
+            self._body = self.text.encode('utf-8')
+        return self._body
+
+    @property
+    def event_id(self):
+        return f"{BOOT_ID}-{self.sequence}"
+
+    @property
+    def sse(self):
+        """一条完整的 SSE 事件"""
+        if self._sse is None:
+            self._sse = f"id: {self.event_id}\ndata: {self.text}\n\n".encode('utf-8')
+        return self._sse
+
+
+class ViewerChannel:
+    """单个网页客户端的发送通道
+
+    订阅参数：
+        max_rate      每秒最多发送几条，限速期间到达的样本合并为最新的一条
+        changes_only  心率值与上次发送的相同时不发送
+    """
+
+    def __init__(self, ws, max_queue=4, stall_timeout=10.0, on_evict=None,
+                 max_rate=None, changes_only=False):
+        self.ws = ws
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        # 队列满时 deque 自动丢弃最旧的帧，只保留最新的心率数据；限速时只留一条
+        self.queue = deque(maxlen=1 if self.min_interval else max_queue)
+        self.changes_only = changes_only
+        self.last_value = None
+        self.stall_timeout = stall_timeout
+        self.on_evict = on_evict
+        self.dropped = 0
+        self.closed = False
+        self.writer_task = None
+        self._next_send = 0.0
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        """启动后台写任务"""
+        self.writer_task = asyncio.create_task(self._writer())
+        return self
+
+    def push(self, message):
+        """放入一条待发送的 Sample，不阻塞"""
+        if self.closed:
+            return False
+        if len(self.queue) == self.queue.maxlen:
+            if self.min_interval:
+                metrics.VIEWER_COALESCED_FRAMES.inc()
+            else:
+                self.dropped += 1
+                metrics.VIEWER_DROPPED_FRAMES.inc()
+        self.queue.append(message)
+        self._wakeup.set()
+        return True
+
+    async def _next_sample(self, idle_timeout=None):
+        """取下一条要发送的样本，按订阅限速并跳过未变化的值；空闲超时返回 None"""
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            if not self.queue:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), idle_timeout)
+                except asyncio.TimeoutError:
+                    return None
+                continue
+            delay = self._next_send - loop.time()
+            if delay > 0:
+                # 等待期间新到的样本在队列中覆盖旧的
+                await asyncio.sleep(delay)
+                continue
+            sample = self.queue.popleft()
+            if self.changes_only and sample.value == self.last_value:
+                metrics.VIEWER_COALESCED_FRAMES.inc()
+                continue
+            self.last_value = sample.value
+            self._next_send = loop.time() + self.min_interval
+            return sample
+        return None
+
+    async def _writer(self):
+        """逐条发送队列中的消息，单条发送超过期限则判定为卡死并踢出"""
+        try:
+            while not self.closed:
+                message = await self._next_sample()
+                if message is None:
+                    continue
+                start = time.perf_counter()
+                await asyncio.wait_for(self._send(message), self.stall_timeout)
+                metrics.VIEWER_SEND_SECONDS.observe(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            await self._evict("发送超时")
+        except Exception:
+            await self._evict("发送失败")
+
+    def _send(self, sample):
+        return self.ws.send_str(sample.text)
+
+    async def _close_transport(self, code, reason):
+        if not self.ws.closed:
+            await self.ws.close(code=code, message=reason.encode())
+
+    async def _evict(self, reason):
+        self.closed = True
+        self.queue.clear()
+        if self.on_evict:
+            self.on_evict(self, reason)
+        try:
+            await asyncio.wait_for(self._close_transport(1011, reason), 2)
+        except Exception:
+            pass
+
+    async def close(self):
+        """停止写任务并关闭连接"""
+        self.closed = True
+        self._wakeup.set()
+        if self.writer_task and not self.writer_task.done():
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self._close_transport(1000, '')
+        except Exception:
+            pass
+
+
+class EventStreamViewer(ViewerChannel):
+    """SSE（text/event-stream）观众，ws 是已 prepare 的 aiohttp StreamResponse
+
+    没有新数据时定期写一行注释，既保持代理不断开，也能及时发现已经走掉的客户端。
+    """
+
+    KEEPALIVE = b": keepalive\n\n"
+
+    def __init__(self, response, max_queue=4, stall_timeout=10.0, on_evict=None,
+                 max_rate=None, changes_only=False, keepalive_interval=15.0):
+        super().__init__(response, max_queue, stall_timeout, on_evict, max_rate, changes_only)
+        self.keepalive_interval = keepalive_interval
+        self.finished = asyncio.Event()
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                sample = await self._next_sample(self.keepalive_interval)
+                if sample is None:
+                    if not self.closed:
+                        await asyncio.wait_for(self.ws.write(self.KEEPALIVE), self.stall_timeout)
+                    continue
+                start = time.perf_counter()
+                await asyncio.wait_for(self.ws.write(sample.sse), self.stall_timeout)
+                metrics.VIEWER_SEND_SECONDS.observe(time.perf_counter() - start)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            await self._evict("发送超时")
+        except Exception:
+            # 写入失败说明客户端已经走了，属于正常断开
+            self.closed = True
+        finally:
+            self.finished.set()
+
+    async def _close_transport(self, code, reason):
+        # 请求处理函数在等 finished，返回后 aiohttp 结束这个响应
+        self.finished.set()
+
+    async def wait_closed(self):
+        await self.finished.wait()
+
+
+class ViewerHub:
+    """所有网页客户端的集合，提供与 set 相近的 add/discard/len 接口"""
+
+    def __init__(self, max_queue=4, stall_timeout=10.0, log=plain_log):
+        self.max_queue = max_queue
+        self.stall_timeout = stall_timeout
+        self.log = log
+        self.channels = {}
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __contains__(self, ws):
+        return ws in self.channels
+
+    def __iter__(self):
+        return iter(list(self.channels))
+
+    def add(self, ws, kind=ViewerChannel, **subscription):
+        """登记新客户端并启动其写任务，subscription 为 max_rate / changes_only"""
+        channel = kind(ws, self.max_queue, self.stall_timeout, on_evict=self._on_evict,
+                       **subscription)
+        self.channels[ws] = channel
+        return channel.start()
+
+    def discard(self, ws):
+        channel = self.channels.pop(ws, None)
+        if channel:
+            channel.closed = True
+            if channel.writer_task and not channel.writer_task.done():
+                channel.writer_task.cancel()
+
+    def _on_evict(self, channel, reason):
+        if self.channels.pop(channel.ws, None) is not None:
+            metrics.VIEWER_EVICTIONS.inc()
+            self.log(f"[🌐] 踢出卡住的网页客户端（{reason}），当前连接数：{len(self.channels)}", WARNING)
+
+    def publish(self, sample):
+        """把样本放入所有客户端的队列，耗时只与客户端数量有关"""
+        for channel in self.channels.values():
+            channel.push(sample)
+        return len(self.channels)
+
+    async def close_all(self):
+        """关闭所有客户端连接"""
+        channels = list(self.channels.values())
+        self.channels.clear()
+        for channel in channels:
+            await channel.close()
+
+    def clear(self):
+        self.channels.clear()
+
+
+class SourceChannel:
+    """单个心率来源的最新值、历史记录与订阅者集合"""
+
+    def __init__(self, source_id, viewers, history_size=65536, zones=DEFAULT_ZONES):
+        self.source_id = source_id
+        self.latest = None
+        self.sample = None  # 最新的预编码样本
+        self.sequence = 0
+        self.viewers = viewers
+        self.history = HistoryRing(history_size)
+        self.stats = RollingStats(zones=zones)  # 滑动窗口统计和区间时间，随样本增量更新
+        self._changed = None  # 长轮询等待的 Future，有新样本时完成并换新
+
+    def update(self, value, text):
+        """记录新样本、唤醒长轮询，返回样本供推送"""
+        self.sequence += 1
+        self.latest = value
+        self.sample = Sample(self.sequence, value, text)
+        waiter, self._changed = self._changed, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(self.sample)
+        return self.sample
+
+    def wake(self):
+        """让正在长轮询的请求立即返回，关闭时使用"""
+        waiter, self._changed = self._changed, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait_changed(self, timeout):
+        """等到下一个样本或超时，超时返回 None"""
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        try:
+            # 多个长轮询共用一个 Future，shield 保证某个请求超时不会取消它
+            return await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ChannelRegistry:
+    """按来源划分的推送频道，/ws?source=<id> 订阅指定来源
+
+    第一个登记的来源是默认频道，不带 source 参数的连接订阅它。
+    """
+
+    def __init__(self, max_queue=4, stall_timeout=10.0, log=plain_log, zones=DEFAULT_ZONES):
+        self.max_queue = max_queue
+        self.stall_timeout = stall_timeout
+        self.zones = zones  # 新建频道使用的心率区间边界
+        self.log = log
+        self.channels = {}
+        self.default_id = None
+
+    def __len__(self):
+        """所有来源的订阅者总数"""
+        return sum(len(channel.viewers) for channel in self.channels.values())
+
+    def ensure(self, source_id):
+        """获取来源频道，不存在则创建"""
+        channel = self.channels.get(source_id)
+        if channel is None:
+            viewers = ViewerHub(self.max_queue, self.stall_timeout, self.log)
+            channel = self.channels[source_id] = SourceChannel(source_id, viewers, zones=self.zones)
+            if self.default_id is None:
+                self.default_id = source_id
+        return channel
+
+    def get(self, source_id=None):
+        """按 id 查找频道，id 为空时返回默认频道"""
+        if not source_id:
+            source_id = self.default_id
+        return self.channels.get(source_id)
+
+    async def close_all(self):
+        for channel in self.channels.values():
+            channel.wake()
+            await channel.viewers.close_all()
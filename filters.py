@@ -0,0 +1,182 @@
+"""心率信号的流式处理：异常值剔除、EMA 平滑、RR 间期与 HRV（RMSSD）
+
+位于流水线的处理级，每个样本的处理代价是常数：
+    中位数窗口很小且固定，维护一个有序列表，插入和删除用 bisect
+    EMA 按实际时间间隔计算系数，采样率变化时平滑程度不变
+    RMSSD 维护相邻 RR 间期差值平方的滑动和，不重新遍历窗口
+"""
+import bisect
+import math
+import time
+from collections import deque
+
+import metrics
+
+
+class MedianOutlierFilter:
+    """滑动中位数异常值剔除
+
+    超出生理范围（如传感器脱落时的 0、255）或偏离最近 window 个原始值的中位数
+    超过 max_jump 的样本被丢弃。持续的真实变化在占满半个窗口后会拉动中位数，随即被接受。
+    """
+
+    def __init__(self, window=7, max_jump=30, min_bpm=25, max_bpm=240):
+        self.window = window
+        self.max_jump = max_jump
+        self.min_bpm = min_bpm
+        self.max_bpm = max_bpm
+        self.recent = deque()
+        self.ordered = []
+
+    def median(self):
+        n = len(self.ordered)
+        middle = n // 2
+        if n % 2:
+            return self.ordered[middle]
+        return (self.ordered[middle - 1] + self.ordered[middle]) / 2
+
+    def check(self, value):
+        """接受返回 None，否则返回丢弃原因"""
+        if not self.min_bpm <= value <= self.max_bpm:
+            # 超出范围的值不进入窗口，不会影响中位数
+            return 'range'
+        self.recent.append(value)
+        bisect.insort(self.ordered, value)
+        if len(self.recent) > self.window:
+            oldest = self.recent.popleft()
+            del self.ordered[bisect.bisect_left(self.ordered, oldest)]
+        if len(self.ordered) >= 3 and abs(value - self.median()) > self.max_jump:
+            return 'jump'
+        return None
+
+
+class EmaFilter:
+    """按时间常数平滑的指数移动平均，time_constant 秒后旧值的权重降到 1/e"""
+
+    def __init__(self, time_constant=2.0):
+        self.time_constant = time_constant
+        self.value = None
+        self.last_time = None
+
+    def update(self, value, timestamp):
+        if self.value is None or self.time_constant <= 0:
+            self.value = value
+        else:
+            dt = max(0.0, timestamp - self.last_time)
+            self.value += (1 - math.exp(-dt / self.time_constant)) * (value - self.value)
+        self.last_time = timestamp
+        return self.value
+
+
+class RRAnalyzer:
+    """RR 间期（毫秒）的滑动 RMSSD
+
+    超出 min_rr..max_rr 的间期直接丢弃；与上一个间期相差超过 max_change 比例的
+    视为早搏或漏检，不计入差值，但作为下一个差值的起点。
+    """
+
+    def __init__(self, window=30, min_rr=300, max_rr=2000, max_change=0.2):
+        self.window = window
+        self.min_rr = min_rr
+        self.max_rr = max_rr
+        self.max_change = max_change
+        self.last = None
+        self.squares = deque()
+        self.sum_squares = 0.0
+
+    def add(self, rr):
+        """加入一个 RR 间期，返回是否计入 RMSSD"""
+        if not self.min_rr <= rr <= self.max_rr:
+            return False
+        last, self.last = self.last, rr
+        if last is None or abs(rr - last) > self.max_change * last:
+            return False
+        square = (rr - last) ** 2
+        self.squares.append(square)
+        self.sum_squares += square
+        if len(self.squares) > self.window:
+            self.sum_squares -= self.squares.popleft()
+        return True
+
+    @property
+    def rmssd(self):
+        if not self.squares:
+            return None
+        return math.sqrt(max(0.0, self.sum_squares) / len(self.squares))
+
+
+class Reading:
+    """处理后的一个样本"""
+
+    __slots__ = ('value', 'raw', 'rr', 'rmssd')
+
+    def __init__(self, value, raw, rr=None, rmssd=None):
+        self.value = value
+        self.raw = raw
+        self.rr = rr
+        self.rmssd = rmssd
+
+
+class SignalProcessor:
+    """每个来源一个，依次执行异常值剔除、平滑和 HRV 计算
+
+    outlier=False 关闭异常值剔除，smoothing 为 EMA 时间常数（秒，0 为不平滑），
+    hrv_window 为计算 RMSSD 的 RR 差值个数。被剔除的样本不会推送和录制，
+    其 RR 间期也不计入 RMSSD，实时值与录制文件的离线分析使用同一串间期。
+    """
+
+    def __init__(self, outlier=True, median_window=7, max_jump=30,
+                 smoothing=0.0, hrv_window=30, clock=time.monotonic):
+        self.outlier = MedianOutlierFilter(median_window, max_jump) if outlier else None
+        self.ema = EmaFilter(smoothing) if smoothing > 0 else None
+        self.rr = RRAnalyzer(hrv_window)
+        self.clock = clock
+
+    def process(self, value, rr=None, timestamp=None):
+        """返回 Reading；被判定为异常值时返回 None"""
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            # 不是数字的心率原样推送
+            return Reading(value, value, rr, self._add_rr(rr))
+
+        if self.outlier is not None:
+            reason = self.outlier.check(number)
+            if reason is not None:
+                metrics.SAMPLES_REJECTED.labels(reason).inc()
+                return None
+        rmssd = self._add_rr(rr)
+        if self.ema is not None:
+            number = self.ema.update(number, self.clock() if timestamp is None else timestamp)
+            # 整数心率平滑后仍显示为整数
+            value = round(number) if isinstance(value, int) else round(number, 1)
+        return Reading(value, number, rr, rmssd)
+
+    def _add_rr(self, rr):
+        """加入样本附带的 RR 间期，返回当前 RMSSD；没有 RR 时为 None"""
+        if not rr:
+            return None
+        for interval in rr:
+            self.rr.add(interval)
+        return self.rr.rmssd
+
+
+def add_filter_arguments(parser):
+    """命令行版本和 GUI 版本共用的滤波参数"""
+    group = parser.add_argument_group('心率滤波')
+    group.add_argument('--no-outlier', action='store_true', help='不剔除异常值')
+    group.add_argument('--median-window', type=int, default=7, help='异常值判断的中位数窗口（样本数）')
+    group.add_argument('--max-jump', type=float, default=30, help='偏离中位数超过多少 bpm 视为异常值')
+    group.add_argument('--smooth', type=float, default=0.0, metavar='秒',
+                       help='EMA 平滑时间常数，0 为不平滑')
+    group.add_argument('--hrv-window', type=int, default=30, help='计算 RMSSD 的 RR 差值个数')
+
+
+def filter_options(args):
+    return {
+        'outlier': not args.no_outlier,
+        'median_window': max(1, args.median_window),
+        'max_jump': args.max_jump,
+        'smoothing': max(0.0, args.smooth),
+        'hrv_window': max(1, args.hrv_window),
+    }
@@ -0,0 +1,83 @@
+"""内存中的心率历史环形缓冲区
+
+时间戳和心率分别存放在两个定长 array 中，追加为 O(1)，
+不为每个样本创建 Python 对象，长时间运行内存也不会增长。
+"""
+import time
+from array import array
+
+
+class HistoryRing:
+    """定容环形缓冲区，保存 (单调时钟时间戳, 心率) 样本"""
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('f', bytes(4 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, value, timestamp=None):
+        """追加一个样本，缓冲区满时覆盖最旧的样本"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.size < self.capacity:
+            index = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+
+    def _timestamp_at(self, i):
+        return self.timestamps[(self.start + i) % self.capacity]
+
+    def _bisect(self, timestamp):
+        """返回第一个时间戳 >= timestamp 的逻辑下标"""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, since, until=None, points=300):
+        """取 [since, until] 时间段内的样本，按时间等分降采样到最多 points 个点
+
+        返回 [(时间戳, 平均心率), ...]，时间戳为各时间桶内样本的平均时间。
+        """
+        if until is None:
+            until = time.monotonic()
+        first = self._bisect(since)
+        last = self._bisect(until + 1e-9)
+        count = last - first
+        if count <= 0 or points <= 0:
+            return []
+
+        capacity, start = self.capacity, self.start
+        timestamps, values = self.timestamps, self.values
+        if count <= points:
+            result = []
+            for i in range(first, last):
+                index = (start + i) % capacity
+                result.append((timestamps[index], values[index]))
+            return result
+
+        span = (until - since) or 1.0
+        sums_t = [0.0] * points
+        sums_v = [0.0] * points
+        counts = [0] * points
+        for i in range(first, last):
+            index = (start + i) % capacity
+            t = timestamps[index]
+            bucket = min(int((t - since) / span * points), points - 1)
+            sums_t[bucket] += t
+            sums_v[bucket] += values[index]
+            counts[bucket] += 1
+        return [(sums_t[b] / n, sums_v[b] / n) for b, n in enumerate(counts) if n]
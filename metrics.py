@@ -0,0 +1,198 @@
+"""轻量级 Prometheus 文本格式指标
+
+只做计数、赋值和按固定桶累加，采集开销是几次字典查找和整数加法，
+可以在生产环境常开。/metrics 请求时才生成文本。
+"""
+import bisect
+import math
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].value += amount
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.functions = {}
+
+    def set(self, value):
+        self.children[()].value = value
+
+    def set_function(self, function, *values):
+        """取值时调用 function，适合连接数、队列深度这类现成就有的数据；values 为标签值"""
+        values = tuple(str(v) for v in values)
+        self.labels(*values)
+        self.functions[values] = function
+
+    def _render_child(self, values, child):
+        value = child.value
+        function = self.functions.get(values)
+        if function is not None:
+            try:
+                value = function()
+            except Exception:
+                pass
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                       0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def _render_child(self, values, child):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+
+REGISTRY = []
+
+
+def render():
+    """生成 Prometheus 文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+UPSTREAM_MESSAGES = Counter(
+    'heartrate_upstream_messages_total', '收到的上游消息数，按类型区分', ['type'])
+JSON_DECODE_ERRORS = Counter(
+    'heartrate_json_decode_errors_total', '上游消息 JSON 解析失败次数')
+RECONNECT_ATTEMPTS = Counter(
+    'heartrate_reconnect_attempts_total', '上游重连次数', ['source'])
+RECONNECT_DELAY = Gauge(
+    'heartrate_reconnect_delay_seconds', '当前的重连等待时间', ['source'])
+CONNECTED_VIEWERS = Gauge(
+    'heartrate_connected_viewers', '当前连接的网页客户端数')
+BROADCAST_SECONDS = Histogram(
+    'heartrate_broadcast_duration_seconds', 'broadcast_heart_rate 单次耗时')
+VIEWER_SEND_SECONDS = Histogram(
+    'heartrate_viewer_send_seconds', '单个网页客户端单条消息的发送耗时')
+VIEWER_EVICTIONS = Counter(
+    'heartrate_viewer_evictions_total', '因发送卡住或失败被踢出的网页客户端数')
+VIEWER_DROPPED_FRAMES = Counter(
+    'heartrate_viewer_dropped_frames_total', '网页客户端队列满时丢弃的旧帧数')
+VIEWER_COALESCED_FRAMES = Counter(
+    'heartrate_viewer_coalesced_frames_total', '按订阅限速合并或因数值未变化而跳过的帧数')
+RECOVERY_SECONDS = Histogram(
+    'heartrate_recovery_seconds', '上游连接从中断到恢复的用时',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+LAST_RECOVERY_SECONDS = Gauge(
+    'heartrate_last_recovery_seconds', '最近一次上游连接恢复用时', ['source'])
+PIPELINE_QUEUE_DEPTH = Gauge(
+    'heartrate_pipeline_queue_depth', '流水线各级待处理的消息数', ['source', 'stage'])
+PIPELINE_STAGE_SECONDS = Histogram(
+    'heartrate_pipeline_stage_seconds', '流水线各级单条消息的处理耗时', ['source', 'stage'],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+             0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+SAMPLES_REJECTED = Counter(
+    'heartrate_samples_rejected_total', '被异常值过滤丢弃的心率样本数', ['reason'])
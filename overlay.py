@@ -0,0 +1,214 @@
+"""网页心率显示页面（OBS 浏览器源）及其缓存和压缩
+
+页面不引用任何外部资源，心形图标是内联 SVG，断网时也能立即显示。
+页面在启动时编码一次：原文、gzip，装了 brotli 时再加一份 br。
+每次请求只需按 Accept-Encoding 选一份现成的字节、比对 ETag，
+浏览器带 If-None-Match 刷新时直接回 304，不再传输页面。
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 页面随程序升级才会变化，短时间内的刷新直接用浏览器缓存，过期后用 ETag 确认
+CACHE_CONTROL = 'public, max-age=300'
+
+OVERLAY_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>心率显示</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body, html {
+            width: 100%;
+            height: 100%;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            background: transparent;
+            font-family: Arial, sans-serif;
+        }
+
+        .container {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            white-space: nowrap;
+        }
+
+        .heart-icon {
+            display: inline-block;
+            width: 60px;
+            height: 60px;
+            color: #ff4757;
+            margin-right: 15px;
+            animation: heartbeat 1.5s infinite;
+            transform-origin: center;
+            vertical-align: middle;
+        }
+
+        .heart-rate {
+            display: inline-block;
+            font-size: 80px;
+            font-weight: bold;
+            color: #ff6b81;
+            text-shadow: 0 0 10px rgba(255, 107, 129, 0.7);
+            vertical-align: middle;
+        }
+
+        @keyframes heartbeat {
+            0% { transform: scale(1); }
+            25% { transform: scale(1.1); }
+            50% { transform: scale(1); }
+            75% { transform: scale(1.1); }
+            100% { transform: scale(1); }
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <svg class="heart-icon" viewBox="0 0 24 24" aria-hidden="true">
+            <path fill="currentColor" d="M12 21.35l-1.45-1.32C5.4 15.36 2 12.28 2 8.5 2 5.42 4.42 3 7.5 3c1.74 0 3.41.81 4.5 2.09C13.09 3.81 14.76 3 16.5 3 19.58 3 22 5.42 22 8.5c0 3.78-3.4 6.86-8.55 11.54L12 21.35z"/>
+        </svg>
+        <div class="heart-rate" id="currentRate">--</div>
+    </div>
+
+    <script>
+        const accessCode = 'XPH5qChgcd';
+        let ws = null;
+
+        function connectWebSocket() {
+            const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+            const host = window.location.host;
+
+            ws = new WebSocket(protocol + host + '/ws' + window.location.search);
+
+            ws.onopen = function() {
+                ws.send(JSON.stringify({
+                    type: 'auth',
+                    code: accessCode
+                }));
+            };
+
+            ws.onmessage = function(event) {
+                try {
+                    const data = JSON.parse(event.data);
+                    if (data.type === 'heart_rate') {
+                        updateHeartRate(data.current);
+                    }
+                } catch (e) {
+                    console.error('数据解析错误:', e);
+                }
+            };
+
+            ws.onclose = function() {
+                setTimeout(connectWebSocket, 3000);
+            };
+
+            ws.onerror = function(error) {
+                console.error('WebSocket 错误:', error);
+            };
+        }
+
+        function updateHeartRate(current) {
+            const rateElement = document.getElementById('currentRate');
+            const heartIcon = document.querySelector('.heart-icon');
+
+            if (rateElement) {
+                rateElement.textContent = current !== undefined ? current : '--';
+            }
+
+            if (heartIcon && current !== '--' && current !== null && !isNaN(current)) {
+                const rate = parseInt(current);
+                const duration = Math.max(0.5, 2 - (rate - 60) / 100);
+                heartIcon.style.animationDuration = duration + 's';
+            }
+        }
+
+        window.addEventListener('load', connectWebSocket);
+    </script>
+</body>
+</html>'''
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class StaticAsset:
+    """预先编码好的静态资源，每种编码各有一个强 ETag"""
+
+    ENCODINGS = ('br', 'gzip')  # 按优先级排列
+
+    def __init__(self, body, content_type, cache_control=CACHE_CONTROL):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {'identity': (body, f'"{digest}"')}
+        encoded = {'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body, quality=11)
+        for encoding, data in encoded.items():
+            if len(data) < len(body):
+                self.variants[encoding] = (data, f'"{digest}-{encoding}"')
+
+    def select(self, accept_encoding):
+        """按客户端支持的编码选出 (编码, 字节, ETag)"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in self.ENCODINGS:
+            if encoding in self.variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+    @staticmethod
+    def not_modified(if_none_match, etag):
+        """If-None-Match 是否命中（按弱比较，忽略 W/ 前缀）"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+    def response(self, request):
+        from aiohttp import web
+
+        encoding, body, etag = self.select(request.headers.get('Accept-Encoding'))
+        headers = {
+            'ETag': etag,
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if self.not_modified(request.headers.get('If-None-Match'), etag):
+            return web.Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        headers['Content-Type'] = self.content_type
+        return web.Response(body=body, headers=headers)
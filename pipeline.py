@@ -0,0 +1,159 @@
+"""上游接收 → 数据处理 → 网页推送 三级流水线
+
+各级之间用信箱连接，写入方永远不会等待，所以上游读取循环不会被下游推送拖慢，
+也就不会因此触发 ping 超时重连。信箱不合并样本：历史、录制和滑动统计需要每一个样本，
+合并只在各网页客户端自己的发送队列中进行（见 fanout.ViewerChannel）。
+接收信箱有一个很大的上限，只防止处理级失控时内存无限增长，超出时丢弃最旧的并计数。
+指定 source 时，各级的队列深度和单条耗时同时计入 /metrics。
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+
+import metrics
+from console import ERROR, plain_log
+
+
+class Mailbox:
+    """信箱，maxlen 为 None 时不限长度，否则满时丢弃最旧的一条"""
+
+    def __init__(self, maxlen=None):
+        self.items = deque(maxlen=maxlen)
+        self.coalesced = 0
+        self._event = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        """写入数据，不阻塞；有上限且已满时覆盖最旧的一条"""
+        if len(self.items) == self.items.maxlen:
+            self.coalesced += 1
+        self.items.append(item)
+        self._event.set()
+
+    async def get(self):
+        while not self.items:
+            self._event.clear()
+            await self._event.wait()
+        return self.items.popleft()
+
+
+class StageStats:
+    """单级的处理计数与耗时统计，histogram 为对应的 /metrics 直方图"""
+
+    def __init__(self, name, mailbox=None, histogram=None):
+        self.name = name
+        self.mailbox = mailbox
+        self.histogram = histogram
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if self.histogram is not None:
+            self.histogram.observe(elapsed)
+
+    def snapshot(self):
+        return {
+            "stage": self.name,
+            "depth": len(self.mailbox) if self.mailbox is not None else 0,
+            "coalesced": self.mailbox.coalesced if self.mailbox is not None else 0,
+            "count": self.count,
+            "avg_ms": self.total_time / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max_time * 1000,
+            "last_ms": self.last_time * 1000,
+        }
+
+
+class Pipeline:
+    """接收、处理、推送三级流水线
+
+    process(message) 把原始消息解析为心率值（非心率消息返回 None），
+    fanout(value) 负责推送，可以是普通函数也可以是协程函数。
+    各级的异常通过 log(message, level) 输出。
+    """
+
+    def __init__(self, process, fanout, inbox_size=65536, log=plain_log, source=None):
+        self.process = process
+        self.fanout = fanout
+        self.log = log
+        self.inbox = Mailbox(maxlen=inbox_size)
+        self.processed = Mailbox()  # 不合并，每个样本都要进入历史、录制和统计
+        self.ingest_stats = StageStats("ingest")
+        self.process_stats = StageStats("process", self.inbox)
+        self.fanout_stats = StageStats("fanout", self.processed)
+        self.tasks = []
+        if source is not None:
+            for stats in (self.ingest_stats, self.process_stats, self.fanout_stats):
+                stats.histogram = metrics.PIPELINE_STAGE_SECONDS.labels(source, stats.name)
+                if stats.mailbox is not None:
+                    metrics.PIPELINE_QUEUE_DEPTH.set_function(stats.mailbox.__len__, source, stats.name)
+
+    def feed(self, message):
+        """上游读取循环调用，只做入队"""
+        start = time.perf_counter()
+        self.inbox.put(message)
+        self.ingest_stats.record(time.perf_counter() - start)
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [
+                asyncio.create_task(self._process_loop()),
+                asyncio.create_task(self._fanout_loop()),
+            ]
+        return self
+
+    async def stop(self):
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _process_loop(self):
+        while True:
+            message = await self.inbox.get()
+            start = time.perf_counter()
+            try:
+                value = self.process(message)
+            except Exception as e:
+                self.log(f"[流水线] 处理错误：{e}", ERROR)
+                value = None
+            self.process_stats.record(time.perf_counter() - start)
+            if value is not None:
+                self.processed.put(value)
+
+    async def _fanout_loop(self):
+        while True:
+            value = await self.processed.get()
+            start = time.perf_counter()
+            try:
+                result = self.fanout(value)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.log(f"[流水线] 推送错误：{e}", ERROR)
+            self.fanout_stats.record(time.perf_counter() - start)
+
+    def snapshot(self):
+        return [self.ingest_stats.snapshot(), self.process_stats.snapshot(),
+                self.fanout_stats.snapshot()]
+
+    def report(self):
+        """生成一行各级队列深度与耗时的摘要"""
+        parts = []
+        for s in self.snapshot():
+            parts.append(f"{s['stage']} 深度={s['depth']} 处理={s['count']} 丢弃={s['coalesced']} "
+                         f"平均={s['avg_ms']:.3f}ms 最大={s['max_ms']:.3f}ms")
+        return " | ".join(parts)
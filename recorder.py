@@ -0,0 +1,239 @@
+"""心率会话录制与读取
+
+录制文件是只追加的定长二进制记录，每个来源单独一个文件：
+    文件头 16 字节：魔数 b'HRREC\\x00\\x01\\x00' + 记录长度(uint32) + 保留(uint32)
+    记录   16 字节：Unix 时间戳(double) + 心率(float) + RR 间期毫秒(float，无则为 NaN)
+一个样本带多个 RR 间期时，第一个写在样本记录里，其余各写一条心率为 NaN 的续行记录，
+时间戳与样本相同；iter_samples 把续行合并回所属的样本。
+
+写入时样本先打包进内存缓冲区，由后台任务定期在线程池中批量写盘，
+事件循环不会因磁盘 IO 阻塞。读取使用 mmap，多小时的文件也无需整体载入内存。
+"""
+import asyncio
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from datetime import datetime
+
+from console import ERROR, plain_log
+
+MAGIC = b'HRREC\x00\x01\x00'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<dff')
+FILE_SUFFIX = '.hrr'
+
+
+class _SourceFile:
+    """单个来源当前正在写入的文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, RECORD.size, 0))
+        self.opened_at = time.monotonic()
+
+    @property
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        try:
+            self.file.close()
+        except OSError:
+            pass
+
+
+class SessionRecorder:
+    """按来源录制心率样本，按大小或时长轮换文件"""
+
+    def __init__(self, directory, rotate_bytes=64 * 1024 * 1024, rotate_seconds=3600,
+                 flush_interval=1.0, log=plain_log):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.flush_interval = flush_interval
+        self.log = log
+        self.buffers = {}
+        self.files = {}
+        self.records = 0
+        self.flush_task = None
+        self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+        return self
+
+    def record(self, source, value, rr=None, timestamp=None):
+        """记录一个样本及其 RR 间期列表，只写内存缓冲区，不阻塞"""
+        buffer = self.buffers.get(source)
+        if buffer is None:
+            buffer = self.buffers[source] = bytearray()
+        if timestamp is None:
+            timestamp = time.time()
+        if not rr:
+            buffer += RECORD.pack(timestamp, value, math.nan)
+            self.records += 1
+            return
+        buffer += RECORD.pack(timestamp, value, rr[0])
+        for interval in rr[1:]:
+            buffer += RECORD.pack(timestamp, math.nan, interval)
+        self.records += len(rr)
+
+    async def _flush_loop(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """把缓冲区交给线程池写盘"""
+        async with self._flush_lock:
+            batches = {source: bytes(buffer) for source, buffer in self.buffers.items() if buffer}
+            if not batches:
+                return
+            for source in batches:
+                self.buffers[source] = bytearray()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write_batches, batches)
+            except OSError as e:
+                self.log(f"[录制] 写入失败：{e}", ERROR)
+
+    def _file_for(self, source, incoming):
+        current = self.files.get(source)
+        if current is not None:
+            too_big = self.rotate_bytes and current.size + incoming > self.rotate_bytes
+            too_old = self.rotate_seconds and time.monotonic() - current.opened_at >= self.rotate_seconds
+            if too_big or too_old:
+                current.close()
+                current = None
+        if current is None:
+            safe = re.sub(r'[^\w.-]', '_', str(source))
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]
+            path = os.path.join(self.directory, f"{safe}_{stamp}{FILE_SUFFIX}")
+            serial = 1
+            while os.path.exists(path):
+                path = os.path.join(self.directory, f"{safe}_{stamp}-{serial}{FILE_SUFFIX}")
+                serial += 1
+            current = self.files[source] = _SourceFile(path)
+        return current
+
+    def _write_batches(self, batches):
+        """在线程池中执行：写入并刷新到磁盘"""
+        for source, data in batches.items():
+            target = self._file_for(source, len(data))
+            target.file.write(data)
+            target.file.flush()
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+        for target in self.files.values():
+            target.close()
+        self.files.clear()
+
+
+class SessionReader:
+    """用 mmap 读取录制文件，支持按下标或时间切片"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            self.file.close()
+            raise ValueError(f"不是有效的录制文件：{path}")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"不是有效的录制文件：{path}")
+        # 末尾可能有写了一半的记录，忽略之
+        self.count = (size - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self.map.close()
+        except (AttributeError, ValueError, BufferError):
+            pass
+        self.file.close()
+
+    def record_at(self, index):
+        """返回第 index 条记录 (时间戳, 心率, RR)"""
+        return RECORD.unpack_from(self.map, HEADER.size + index * RECORD.size)
+
+    def timestamp_at(self, index):
+        return struct.unpack_from('<d', self.map, HEADER.size + index * RECORD.size)[0]
+
+    def index_of(self, timestamp):
+        """返回第一个时间戳 >= timestamp 的记录下标"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_records(self, start=0, stop=None):
+        """按下标范围逐条读取记录"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return iter(())
+        begin = HEADER.size + start * RECORD.size
+        end = HEADER.size + stop * RECORD.size
+        return RECORD.iter_unpack(memoryview(self.map)[begin:end])
+
+    def slice_time(self, since=None, until=None):
+        """按 Unix 时间范围读取记录"""
+        start = 0 if since is None else self.index_of(since)
+        stop = self.count if until is None else self.index_of(until + 1e-9)
+        return self.iter_records(start, stop)
+
+
+def iter_samples(records):
+    """把 (时间戳, 心率, RR) 记录合并为样本 (时间戳, 心率, RR 列表)，没有 RR 时列表为空"""
+    pending = None
+    for timestamp, value, rr in records:
+        if math.isnan(value):
+            # 续行记录：属于前一个样本的其余 RR 间期
+            if pending is not None and not math.isnan(rr):
+                pending[2].append(rr)
+            continue
+        if pending is not None:
+            yield pending
+        pending = (timestamp, value, [] if math.isnan(rr) else [rr])
+    if pending is not None:
+        yield pending
+
+
+def list_recordings(path):
+    """列出目录下（或单个文件）的录制文件，按文件名排序"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith(FILE_SUFFIX))
+    return [path]
@@ -0,0 +1,101 @@
+"""回放录制的心率会话
+
+从磁盘逐条读取录制文件并送入网页推送，可按实时、N 倍速或不限速回放。
+录制的 RR 间期随样本一起推送，RMSSD 按 hrv_window 重新计算，与实时推送的内容一致。
+不限速回放时推送路径的工作量完全确定，也可以当作推送吞吐量测试。
+样本之间超过 MAX_GAP 秒的空档（两次录制之间、断线）压缩为 MAX_GAP 秒，不按实际时长等待。
+"""
+import asyncio
+import heapq
+import os
+import time
+
+from console import plain_log
+from filters import Reading, RRAnalyzer
+from recorder import FILE_SUFFIX, SessionReader, iter_samples, list_recordings
+
+# 回放时样本间的最长等待（录制时间，秒），与 analytics.MAX_GAP 一致
+MAX_GAP = 5.0
+
+
+def source_of(path):
+    """从文件名 <来源>_<时间>.hrr 取出来源 id"""
+    name = os.path.basename(path)
+    if name.endswith(FILE_SUFFIX):
+        name = name[:-len(FILE_SUFFIX)]
+    source, _, _ = name.rpartition('_')
+    return source or name
+
+
+def group_by_source(paths):
+    """把录制文件按来源分组，组内按文件名（即时间）排序"""
+    groups = {}
+    for path in paths:
+        for recording in list_recordings(path):
+            groups.setdefault(source_of(recording), []).append(recording)
+    for files in groups.values():
+        files.sort()
+    return groups
+
+
+def _iter_source(source, files):
+    for path in files:
+        with SessionReader(path) as reader:
+            for timestamp, value, rr in iter_samples(reader.iter_records()):
+                yield timestamp, source, value, rr
+
+
+def iter_session(groups):
+    """按时间顺序惰性合并各来源的样本，产出 (时间戳, 来源, 心率, RR 列表)"""
+    return heapq.merge(*(_iter_source(source, files) for source, files in groups.items()),
+                       key=lambda record: record[0])
+
+
+async def replay(groups, broadcast, speed=1.0, stop_event=None, log=plain_log, hrv_window=30):
+    """回放一遍录制数据，speed<=0 表示不限速；返回 (样本数, 耗时秒)"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    wall_start = loop.time()
+    first = None
+    previous = None
+    skipped = 0.0  # 被压缩掉的空档总长（录制时间）
+    count = 0
+    analyzers = {source: RRAnalyzer(hrv_window) for source in groups}
+    for timestamp, source, value, rr in iter_session(groups):
+        if stop_event is not None and stop_event.is_set():
+            break
+        if first is None:
+            first = previous = timestamp
+        gap = timestamp - previous
+        if gap > MAX_GAP:
+            skipped += gap - MAX_GAP
+            log(f"[回放] 跳过 {gap:.0f} 秒没有数据的空档")
+        previous = timestamp
+        if speed > 0:
+            delay = wall_start + (timestamp - first - skipped) / speed - loop.time()
+            if delay > 0:
+                if stop_event is None:
+                    await asyncio.sleep(delay)
+                else:
+                    # 等待期间收到停止信号立即结束，不等到下一个样本
+                    try:
+                        await asyncio.wait_for(stop_event.wait(), delay)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+        value = int(value) if value.is_integer() else round(value, 1)
+        reading = None
+        if rr:
+            analyzer = analyzers[source]
+            for interval in rr:
+                analyzer.add(interval)
+            reading = Reading(value, value, rr, analyzer.rmssd)
+        await broadcast(value, source=source, reading=reading)
+        count += 1
+        if speed <= 0:
+            # 让出事件循环，让各网页客户端的写任务有机会发送
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    log(f"[回放] 完成：{count} 个样本，用时 {elapsed:.2f} 秒，{rate:.0f} 样本/秒")
+    return count, elapsed
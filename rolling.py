@@ -0,0 +1,122 @@
+"""滑动窗口统计和心率区间累计时间，随每个样本增量更新
+
+每个窗口用单调队列维护最小值和最大值、用滑动和维护均值：
+新样本入队时从队尾弹出不再可能成为最值的元素，过期样本从队首移出，
+每个样本最多入队出队各一次，均摊 O(1)，不需要重新扫描历史。
+"""
+import argparse
+import bisect
+from collections import deque
+
+# 默认窗口：(名称, 秒数)
+DEFAULT_WINDOWS = (('10s', 10), ('1m', 60), ('10m', 600))
+# 默认区间边界（bpm），前两个与界面颜色的分界一致
+DEFAULT_ZONES = (60, 100, 140, 170)
+
+
+class RollingWindow:
+    """最近 seconds 秒内的最小值、最大值和均值"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()  # (时间戳, 心率)
+        self.minimum = deque()  # 心率单调递增，队首为最小值
+        self.maximum = deque()  # 心率单调递减，队首为最大值
+        self.total = 0.0
+
+    def add(self, value, timestamp):
+        self.samples.append((timestamp, value))
+        self.total += value
+        while self.minimum and self.minimum[-1][1] > value:
+            self.minimum.pop()
+        self.minimum.append((timestamp, value))
+        while self.maximum and self.maximum[-1][1] < value:
+            self.maximum.pop()
+        self.maximum.append((timestamp, value))
+        self.expire(timestamp)
+
+    def expire(self, now):
+        """移出早于 now - seconds 的样本"""
+        cutoff = now - self.seconds
+        samples = self.samples
+        while samples and samples[0][0] < cutoff:
+            self.total -= samples.popleft()[1]
+        while self.minimum and self.minimum[0][0] < cutoff:
+            self.minimum.popleft()
+        while self.maximum and self.maximum[0][0] < cutoff:
+            self.maximum.popleft()
+        if not samples:
+            # 窗口清空时顺便消除浮点累加误差
+            self.total = 0.0
+
+    def snapshot(self):
+        if not self.samples:
+            return None
+        return {
+            "min": self.minimum[0][1],
+            "max": self.maximum[0][1],
+            "mean": round(self.total / len(self.samples), 1),
+        }
+
+
+class ZoneTimer:
+    """各心率区间的累计时间
+
+    两个样本之间的时间计入前一个样本所在的区间；间隔超过 max_gap 秒
+    （断线、回放跳跃）时只计 max_gap 秒，避免把断线时间算进某个区间。
+    """
+
+    def __init__(self, bounds=DEFAULT_ZONES, max_gap=5.0):
+        self.bounds = sorted(bounds)
+        self.max_gap = max_gap
+        self.names = zone_names(self.bounds)
+        self.seconds = [0.0] * len(self.names)
+        self.last_zone = None
+        self.last_time = None
+
+    def add(self, value, timestamp):
+        if self.last_zone is not None:
+            self.seconds[self.last_zone] += min(self.max_gap, max(0.0, timestamp - self.last_time))
+        self.last_zone = bisect.bisect_right(self.bounds, value)
+        self.last_time = timestamp
+
+    def snapshot(self):
+        return {name: round(seconds, 1) for name, seconds in zip(self.names, self.seconds)}
+
+
+def zone_names(bounds):
+    """边界 [60, 100] 对应区间 <60、60-100、>=100"""
+    if not bounds:
+        return ['all']
+    names = [f"<{bounds[0]:g}"]
+    names += [f"{low:g}-{high:g}" for low, high in zip(bounds, bounds[1:])]
+    names.append(f">={bounds[-1]:g}")
+    return names
+
+
+class RollingStats:
+    """一个来源的全部窗口统计和区间时间"""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, zones=DEFAULT_ZONES):
+        self.windows = [(name, RollingWindow(seconds)) for name, seconds in windows]
+        self.zones = ZoneTimer(zones)
+
+    def add(self, value, timestamp):
+        for _, window in self.windows:
+            window.add(value, timestamp)
+        self.zones.add(value, timestamp)
+
+    def snapshot(self):
+        """推送用的统计数据，没有样本的窗口为 None"""
+        return {
+            "windows": {name: window.snapshot() for name, window in self.windows},
+            "zones": self.zones.snapshot(),
+        }
+
+
+def parse_zones(text):
+    """解析 --zones 60,100,140,170"""
+    try:
+        return tuple(sorted(float(item) for item in text.split(',') if item.strip()))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"区间边界格式错误：{text}")
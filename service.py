@@ -0,0 +1,626 @@
+"""心率服务核心：上游客户端、心率推送和网页服务，不依赖任何界面
+
+命令行版本和 GUI 版本都只是驱动 HeartRateService 的外壳，界面相关的部分通过回调注入：
+    log(message)                  输出一行日志
+    on_status(status)             连接状态变化，如“已连接”“连接断开”
+    on_heart_rate(source, value, stats)  收到新的心率，stats 为该来源的滑动窗口统计和区间时间
+
+aiohttp 和 websockets 导入较慢，只在启动网页服务、连接上游时才导入，
+所以 --help、输入 IP、回放前的文件检查等都不需要等它们加载。
+"""
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import metrics
+from backoff import ReconnectScheduler
+from codec import AUTH_FAILED, AUTH_OK, decode_frame, heart_rate_frame, heartbeat_frame, loads
+from console import DEBUG, ERROR, WARNING, plain_log
+from discovery import port_open, remember_address
+from fanout import ChannelRegistry, EventStreamViewer
+from filters import SignalProcessor
+from overlay import OVERLAY_HTML, StaticAsset
+from pipeline import Pipeline
+
+ACCESS_CODE = 'XPH5qChgcd'
+WEB_PORT = 20888
+
+def parse_subscription(query):
+    """从 ?rate=每秒条数&changes=1 解析观众的订阅参数"""
+    from aiohttp import web
+
+    try:
+        rate = float(query.get('rate', 0))
+    except ValueError:
+        raise web.HTTPBadRequest(text="rate 参数错误")
+    return {
+        'max_rate': rate if rate > 0 else None,
+        'changes_only': query.get('changes', '').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def parse_rr(data):
+    """上游消息里的 RR 间期（毫秒），可以是单个数或列表，字段名 rr 或 rr_intervals"""
+    rr = data.get('rr', data.get('rr_intervals'))
+    if rr is None:
+        return None
+    if not isinstance(rr, list):
+        rr = [rr]
+    intervals = []
+    for interval in rr:
+        try:
+            intervals.append(float(interval))
+        except (TypeError, ValueError):
+            pass
+    return intervals or None
+
+
+class HeartRateService:
+    """按来源保存心率、推送给网页客户端，并提供网页服务"""
+
+    def __init__(self, log=plain_log, on_heart_rate=None, on_status=None, verbose=True, filters=None):
+        self.log = log
+        self.on_heart_rate = on_heart_rate
+        self.on_status = on_status
+        self.verbose = verbose  # 是否输出心跳响应、服务器确认等细节
+        self.filters = filters or {}  # 每个上游客户端的 SignalProcessor 参数
+        self.channels = ChannelRegistry(log=log)
+        self.recorder = None  # 可选的会话录制器
+        self.web_runner = None
+        self.index_page = None  # 网页服务启动时预先编码
+        self.is_shutting_down = False
+        metrics.CONNECTED_VIEWERS.set_function(lambda: len(self.channels))
+
+    def client(self, uri, source_id=None, show_source=False):
+        return HeartRateClient(self, uri, source_id, show_source)
+
+    def set_status(self, status):
+        if self.on_status:
+            self.on_status(status)
+
+    async def broadcast(self, value, source=None, reading=None):
+        """广播心率数据到订阅该来源的网页客户端，reading 为处理级附带的 RR 间期和 RMSSD"""
+        started = time.perf_counter()
+        channel = self.channels.ensure(source or self.channels.default_id or "1")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+        if number is not None:
+            channel.history.append(number)
+            channel.stats.add(number, time.monotonic())
+            if self.recorder:
+                self.recorder.record(channel.source_id, number, reading.rr if reading is not None else None)
+        stats = channel.stats.snapshot()
+        if self.on_heart_rate:
+            self.on_heart_rate(channel.source_id, value, stats)
+
+        extra = {"stats": stats}
+        if reading is not None:
+            if reading.rr:
+                extra["rr"] = reading.rr
+            if reading.rmssd is not None:
+                extra["rmssd"] = round(reading.rmssd, 1)
+        # 每个样本只按模板编码一次，WebSocket、SSE、长轮询共用
+        sample = channel.update(value, heart_rate_frame(value, extra))
+
+        # 放入该来源每个客户端各自的发送队列，由各自的写任务发送
+        channel.viewers.publish(sample)
+        metrics.BROADCAST_SECONDS.observe(time.perf_counter() - started)
+
+    # ---------- 网页服务 ----------
+
+    async def handle_websocket(self, request):
+        """处理网页 WebSocket 连接"""
+        from aiohttp import web
+
+        source = self.channels.get(request.query.get('source'))
+        if source is None:
+            raise web.HTTPNotFound(text="未知的心率来源")
+
+        subscription = parse_subscription(request.query)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        viewer = source.viewers.add(ws, **subscription)
+        self.log(f"[🌐] 网页客户端连接（来源 {source.source_id}），当前连接数：{len(self.channels)}", DEBUG)
+
+        # 如果有最新心率数据，立即发送给新连接的客户端
+        if source.sample is not None:
+            viewer.push(source.sample)
+
+        try:
+            async for msg in ws:
+                if msg.type == web.WSMsgType.TEXT:
+                    try:
+                        data = loads(msg.data)
+                        if isinstance(data, dict) and data.get('type') == 'auth':
+                            # 验证访问码
+                            if data.get('code') == ACCESS_CODE:
+                                await ws.send_str(AUTH_OK)
+                            else:
+                                await ws.send_str(AUTH_FAILED)
+                                await ws.close()
+                    except ValueError:
+                        pass
+                elif msg.type == web.WSMsgType.ERROR:
+                    self.log(f"[🌐] WebSocket 错误：{ws.exception()}", WARNING)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if not self.is_shutting_down:
+                self.log(f"[🌐] WebSocket 异常：{e}", WARNING)
+        finally:
+            source.viewers.discard(ws)
+            if not self.is_shutting_down:
+                self.log(f"[🌐] 网页客户端断开，当前连接数：{len(self.channels)}", DEBUG)
+
+        return ws
+
+    async def handle_events(self, request):
+        """SSE 单向推送，适合只需要接收数据的脚本和页面，不需要认证握手"""
+        from aiohttp import web
+
+        source = self.channels.get(request.query.get('source'))
+        if source is None:
+            raise web.HTTPNotFound(text="未知的心率来源")
+
+        subscription = parse_subscription(request.query)
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream; charset=utf-8',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+        await response.prepare(request)
+        await response.write(b"retry: 3000\n\n")
+
+        viewer = source.viewers.add(response, kind=EventStreamViewer, **subscription)
+        self.log(f"[🌐] SSE 客户端连接（来源 {source.source_id}），当前连接数：{len(self.channels)}", DEBUG)
+        # 断线重连时带回的 Last-Event-ID 就是最新样本，则不必重发
+        if source.sample is not None and request.headers.get('Last-Event-ID') != source.sample.event_id:
+            viewer.push(source.sample)
+        try:
+            await viewer.wait_closed()
+        finally:
+            source.viewers.discard(response)
+            if not self.is_shutting_down:
+                self.log(f"[🌐] SSE 客户端断开，当前连接数：{len(self.channels)}", DEBUG)
+        return response
+
+    async def handle_latest(self, request):
+        """最新心率；带 If-None-Match 和 wait=秒 时长轮询，等到新样本或超时（304）才返回"""
+        from aiohttp import web
+
+        source = self.channels.get(request.query.get('source'))
+        if source is None:
+            raise web.HTTPNotFound(text="未知的心率来源")
+        try:
+            wait = max(0.0, min(float(request.query.get('wait', 0)), 60.0))
+        except ValueError:
+            raise web.HTTPBadRequest(text="参数错误")
+
+        headers = {'Cache-Control': 'no-cache'}
+        sample = source.sample
+        known = request.headers.get('If-None-Match')
+        if (sample is None or f'"{sample.event_id}"' == known) and wait:
+            sample = await source.wait_changed(wait) or source.sample
+        if sample is None:
+            return web.Response(status=204, headers=headers)
+        headers['ETag'] = f'"{sample.event_id}"'
+        if headers['ETag'] == known:
+            return web.Response(status=304, headers=headers)
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+        return web.Response(body=sample.body, headers=headers)
+
+    async def handle_history(self, request):
+        """返回最近一段时间的心率历史，服务端降采样到指定点数"""
+        from aiohttp import web
+
+        source = self.channels.get(request.query.get('source'))
+        if source is None:
+            raise web.HTTPNotFound(text="未知的心率来源")
+        try:
+            seconds = float(request.query.get('seconds', 600))
+            points = max(1, min(int(request.query.get('points', 300)), 5000))
+        except ValueError:
+            raise web.HTTPBadRequest(text="参数错误")
+
+        # 缓冲区使用单调时钟，返回时换算成 Unix 时间戳
+        now = time.monotonic()
+        offset = time.time() - now
+        samples = source.history.query(now - seconds, now, points)
+        return web.json_response({
+            "type": "history",
+            "source": source.source_id,
+            "points": [[round(t + offset, 3), round(v, 1)] for t, v in samples],
+        })
+
+    async def handle_metrics(self, request):
+        """Prometheus 文本格式的运行指标"""
+        from aiohttp import web
+
+        return web.Response(body=metrics.render().encode('utf-8'),
+                            headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    async def handle_index(self, request):
+        """心率显示页面，返回预先压缩好的字节，未变化时回 304"""
+        return self.index_page.response(request)
+
+    async def start_web_server(self, host='127.0.0.1', port=WEB_PORT):
+        """启动网页服务器，返回访问地址"""
+        from aiohttp import web
+
+        self.index_page = StaticAsset(OVERLAY_HTML, 'text/html; charset=utf-8')
+        app = web.Application()
+        app.router.add_get('/', self.handle_index)
+        app.router.add_get('/ws', self.handle_websocket)
+        app.router.add_get('/events', self.handle_events)
+        app.router.add_get('/api/latest', self.handle_latest)
+        app.router.add_get('/history', self.handle_history)
+        app.router.add_get('/metrics', self.handle_metrics)
+
+        # 不记录访问日志
+        self.web_runner = web.AppRunner(app, access_log=None)
+        await self.web_runner.setup()
+        site = web.TCPSite(self.web_runner, host, port)
+        await site.start()
+        return f"http://127.0.0.1:{port}"
+
+    async def close(self):
+        """写完录制缓冲区，断开网页客户端并关闭网页服务"""
+        self.is_shutting_down = True
+        if self.recorder:
+            await self.recorder.close()
+        await self.channels.close_all()
+        if self.web_runner:
+            try:
+                await self.web_runner.cleanup()
+            except Exception:
+                pass
+
+
+class HeartRateClient:
+    def __init__(self, service, uri, source_id=None, show_source=False):
+        self.service = service
+        self.log = service.log
+        self.uri = uri
+        self.source_id = source_id
+        # 多个来源时在心率日志前标注来源
+        self.prefix = f"[{source_id}] " if show_source else ""
+        self.websocket = None
+        # 重连等待由调度器按去相关抖动计算，reconnect_delay 只记录当前这次的等待时间
+        self.scheduler = ReconnectScheduler(source=source_id)
+        self.reconnect_delay = 0
+        self.heartbeat_interval = 15
+        self.is_running = True
+        self.heartbeat_task = None
+        self.reconnect_requested = False
+        self.network_failure = False  # 上一次失败是否为网络层错误（连接被拒、超时等）
+        self.validate_timeout = 5
+        self.switch_task = None
+        self.pending_switch = None  # 已验证可用、等待接替当前连接的新连接
+        self.reader_task = None  # 当前连接的读取任务，切换地址时取消
+        self.closing = set()  # 切换后在后台关闭旧连接的任务
+        # 异常值剔除、平滑和 HRV 计算，每个来源各自维护状态
+        self.processor = SignalProcessor(**service.filters)
+        # 接收、处理、推送分级运行，读取循环只负责入队
+        self.pipeline = Pipeline(self.process_message, self.publish, log=self.log, source=source_id)
+
+    def is_connection_open(self):
+        """安全检查连接是否打开"""
+        if self.websocket is None:
+            return False
+        try:
+            if hasattr(self.websocket, 'closed'):
+                return not self.websocket.closed
+            elif hasattr(self.websocket, 'open'):
+                return self.websocket.open
+            else:
+                return True
+        except AttributeError:
+            return False
+
+    def set_status(self, status):
+        self.service.set_status(self.prefix + status)
+
+    def request_reconnect(self, new_uri):
+        """先连上新地址并验证可用，再切换过去并关闭旧连接，切换期间数据不中断"""
+        if self.switch_task and not self.switch_task.done():
+            self.switch_task.cancel()
+        self.switch_task = asyncio.create_task(self._switch_to(new_uri))
+
+    async def open_connection(self, uri):
+        import websockets
+
+        return await websockets.connect(
+            uri,
+            ping_interval=20,
+            ping_timeout=20,
+            close_timeout=10,
+            max_size=2**20,
+            compression=None,
+            open_timeout=self.scheduler.connect_timeout,
+        )
+
+    async def probe_upstream(self):
+        """探测上游端口是否已可连接，用于网络恢复后立即重连"""
+        parsed = urlparse(self.uri)
+        try:
+            port = parsed.port or 80
+        except ValueError:
+            # 地址格式错误（如端口重复），视为不可连接，按正常间隔重试
+            return False
+        return await port_open(parsed.hostname, port, 0.5)
+
+    async def _switch_to(self, uri):
+        if self.websocket is None:
+            # 当前没有可用连接，没有数据流需要保持，直接按新地址重连
+            self.uri = uri
+            self.reconnect_requested = True
+            self.scheduler.wake()
+            return
+
+        self.log(f"[*] 正在连接新地址：{uri}（切换完成前保持当前连接）")
+        websocket = None
+        try:
+            websocket = await asyncio.wait_for(self.open_connection(uri), self.validate_timeout)
+            # 用一次 ping/pong 确认新连接确实可用
+            pong = await websocket.ping()
+            await asyncio.wait_for(pong, self.validate_timeout)
+        except asyncio.CancelledError:
+            if websocket is not None:
+                await websocket.close()
+            raise
+        except Exception as e:
+            self.log(f"[错误] 新地址不可用，继续使用当前连接：{type(e).__name__}", WARNING)
+            if websocket is not None:
+                await websocket.close()
+            return
+
+        if self.pending_switch is not None:
+            self.close_later(self.pending_switch)
+        self.uri = uri
+        self.pending_switch = websocket
+        self.reconnect_requested = True
+        remember_address(urlparse(uri).hostname)
+        # 取消旧连接的读取，读取循环立即接上新连接，旧连接在后台关闭
+        if self.reader_task is not None and not self.reader_task.done():
+            self.reader_task.cancel()
+
+    def close_later(self, websocket):
+        """在后台关闭连接，不等待关闭握手"""
+        task = asyncio.create_task(websocket.close())
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def read_messages(self, websocket):
+        """读取一个连接上的消息放入流水线，连接关闭的异常原样抛出"""
+        async for message in websocket:
+            if not self.is_running:
+                break
+            self.pipeline.feed(message)
+
+    async def send_heartbeat(self):
+        """发送心跳保持连接"""
+        try:
+            if self.is_connection_open():
+                await self.websocket.send(heartbeat_frame())
+        except Exception as e:
+            self.log(f"[心跳失败] {e}", WARNING)
+
+    async def heartbeat_loop(self):
+        """心跳循环"""
+        try:
+            while self.is_running and self.is_connection_open():
+                await asyncio.sleep(self.heartbeat_interval)
+                if self.is_connection_open():
+                    await self.send_heartbeat()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log(f"[心跳错误] {e}", WARNING)
+
+    def handle_message(self, message):
+        """解析一条上游消息，心率消息返回 (心率值, RR 间期列表或 None)，其余返回 None"""
+        verbose = self.service.verbose
+        try:
+            data = decode_frame(message)
+
+            if isinstance(data, dict):
+                msg_type = data.get('type', 'unknown')
+                metrics.UPSTREAM_MESSAGES.labels(
+                    msg_type if msg_type in ('heart_rate', 'heartbeat', 'ack') else 'other').inc()
+
+                if msg_type == 'heart_rate':
+                    value = data.get('value')
+                    self.log(f"  ❤️  {self.prefix}心率：{value} {data.get('unit', 'bpm')}", DEBUG)
+                    return value, parse_rr(data)
+                elif msg_type == 'heartbeat':
+                    if verbose:
+                        self.log("  ✓ 心跳响应", DEBUG)
+                elif msg_type == 'ack':
+                    if verbose:
+                        self.log(f"  ✓ 服务器确认：{data.get('message')}", DEBUG)
+                elif verbose:
+                    self.log(f"  📦 {data}", DEBUG)
+            elif isinstance(data, (int, float)):
+                metrics.UPSTREAM_MESSAGES.labels('number').inc()
+                self.log(f"  ❤️  {self.prefix}心率值：{data} bpm", DEBUG)
+                return data, None
+            else:
+                metrics.UPSTREAM_MESSAGES.labels('raw').inc()
+                self.log(f"  📝 {message}", DEBUG)
+
+        except ValueError:
+            metrics.UPSTREAM_MESSAGES.labels('raw').inc()
+            metrics.JSON_DECODE_ERRORS.inc()
+            self.log(f"  📝 原始：{message}", DEBUG)
+        return None
+
+    def process_message(self, message):
+        """流水线处理级：解析后经过滤波，被剔除的异常值返回 None，不再推送"""
+        parsed = self.handle_message(message)
+        if parsed is None:
+            return None
+        value, rr = parsed
+        reading = self.processor.process(value, rr)
+        if reading is None:
+            self.log(f"  ✗  {self.prefix}丢弃异常心率：{value}", DEBUG)
+        return reading
+
+    def publish(self, reading):
+        return self.service.broadcast(reading.value, self.source_id, reading)
+
+    async def connect(self):
+        """主连接逻辑"""
+        self.pipeline.start()
+        try:
+            await self._connect_loop()
+        finally:
+            await self.pipeline.stop()
+            if self.closing:
+                # 给后台关闭的连接一点时间完成关闭握手
+                await asyncio.wait(self.closing, timeout=1)
+
+    async def _connect_loop(self):
+        import websockets
+
+        while True:
+            self.is_running = True
+            self.reconnect_requested = False
+            self.network_failure = False
+
+            try:
+                if self.pending_switch is not None:
+                    websocket, self.pending_switch = self.pending_switch, None
+                    self.log(f"[✓] 已切换到：{self.uri}")
+                else:
+                    self.log(f"[*] 尝试连接：{self.uri}")
+                    self.set_status("连接中...")
+                    websocket = await self.open_connection(self.uri)
+                    self.log("[✓] 连接成功！")
+                    recovered = self.scheduler.mark_up()
+                    if recovered is not None:
+                        self.log(f"[✓] {self.prefix}连接中断 {recovered:.1f} 秒后恢复")
+                    remember_address(urlparse(self.uri).hostname)
+                    if self.reconnect_requested:
+                        # 连接过程中地址被修改了，放弃这个连接
+                        await websocket.close()
+                        continue
+
+                self.websocket = websocket
+                self.set_status("已连接")
+                self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+
+                reader = self.reader_task = asyncio.create_task(self.read_messages(websocket))
+                try:
+                    await asyncio.wait((reader,))
+                    # 读取任务只会被地址切换或 stop() 取消，不走断线处理：
+                    # 切换时直接接上新连接，停止时随后退出循环
+                    if not reader.cancelled():
+                        reader.result()
+
+                except websockets.exceptions.ConnectionClosedError as e:
+                    self.log(f"[⚠️] 连接异常断开：{e}", WARNING)
+                    self.set_status("连接断开")
+                except websockets.exceptions.ConnectionClosedOK:
+                    # 切换地址时旧连接的正常关闭不必提示
+                    if self.pending_switch is None:
+                        self.log("[✓] 连接正常关闭")
+                        self.set_status("已关闭")
+                except asyncio.CancelledError:
+                    self.log("[⚠️] 连接被取消", WARNING)
+                    break
+                except ConnectionResetError:
+                    self.log("[⚠️] 连接被重置", WARNING)
+                    self.set_status("连接重置")
+                finally:
+                    if not reader.done():
+                        reader.cancel()
+                        await asyncio.wait((reader,))
+                    self.reader_task = None
+                    if self.heartbeat_task and not self.heartbeat_task.done():
+                        self.heartbeat_task.cancel()
+                        try:
+                            await self.heartbeat_task
+                        except asyncio.CancelledError:
+                            pass
+                    self.heartbeat_task = None
+                    self.websocket = None
+                    if self.pending_switch is not None:
+                        self.close_later(websocket)
+                    else:
+                        if self.is_running:
+                            await websocket.close()
+                            self.scheduler.mark_down()
+                        else:
+                            # 停止时 stop() 已在后台关闭连接，不在这里等待关闭握手
+                            self.close_later(websocket)
+                        self.log(f"[流水线] {self.pipeline.report()}")
+
+            except websockets.exceptions.InvalidStatus as e:
+                self.log(f"[错误] HTTP 状态码：{e.response.status_code}", ERROR)
+                self.set_status("连接失败")
+            except ConnectionRefusedError:
+                self.log("[错误] 连接被拒绝", ERROR)
+                self.set_status("连接被拒绝")
+                self.network_failure = True
+            except OSError as e:
+                # 包括连接超时（TimeoutError 是 OSError 的子类）
+                self.log(f"[错误] 网络错误：{e}", ERROR)
+                self.set_status("网络错误")
+                self.network_failure = True
+            except asyncio.CancelledError:
+                self.log("[⚠️] 连接任务被取消", WARNING)
+                break
+            except Exception as e:
+                self.log(f"[错误] 未知：{type(e).__name__}: {e}", ERROR)
+                self.set_status("错误")
+
+            if self.reconnect_requested:
+                if self.pending_switch is None:
+                    self.log(f"[*] 开始重连到：{self.uri}")
+                self.reconnect_requested = False
+                continue
+
+            if not self.is_running:
+                break
+
+            self.reconnect_delay = self.scheduler.next_delay()
+            metrics.RECONNECT_ATTEMPTS.labels(self.source_id).inc()
+            metrics.RECONNECT_DELAY.labels(self.source_id).set(self.reconnect_delay)
+            self.log(f"[*] {self.reconnect_delay:.1f}秒后重连...")
+
+            try:
+                # 停止、改地址会立即唤醒等待；网络层失败时上游端口一恢复可连接也会提前重连，
+                # 端口能连上却被拒绝握手（如 HTTP 403）时探测没有意义，按完整的退避等待
+                probe = self.probe_upstream if self.network_failure else None
+                if await self.scheduler.wait(self.reconnect_delay, probe) \
+                        and self.is_running and not self.reconnect_requested:
+                    self.log("[*] 上游已可连接，立即重连")
+            except asyncio.CancelledError:
+                break
+
+            # 等待期间收到停止信号（而不是重连请求）则退出
+            if not self.is_running and not self.reconnect_requested:
+                break
+
+        self.log("[*] 连接循环已结束")
+
+    def stop(self):
+        """停止客户端"""
+        self.is_running = False
+        self.reconnect_requested = False
+        self.scheduler.wake()
+        if self.switch_task and not self.switch_task.done():
+            self.switch_task.cancel()
+        if self.pending_switch is not None:
+            # 切换完成前停止，读取循环不会再接手这个新连接
+            self.close_later(self.pending_switch)
+            self.pending_switch = None
+        # 上游安静时读取会一直阻塞到下一帧，直接取消读取并在后台关闭连接
+        if self.reader_task is not None and not self.reader_task.done():
+            self.reader_task.cancel()
+        if self.websocket is not None:
+            self.close_later(self.websocket)
+        self.log("[*] 收到停止信号...")
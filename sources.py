@@ -0,0 +1,29 @@
+"""心率来源地址解析"""
+
+DEFAULT_PORT = 6667
+
+
+def parse_sources(text, port=DEFAULT_PORT):
+    """把用户输入解析为 [(来源 id, uri), ...]
+
+    多个地址用逗号或空格分隔，可写成 名称=IP 指定来源 id，
+    未命名的来源按出现顺序编号为 1、2、3……
+    IP 后已带端口（如 127.0.0.1:6671）时使用该端口，不再追加默认端口
+    """
+    sources = []
+    for index, item in enumerate(text.replace('，', ',').replace(',', ' ').split(), 1):
+        if '=' in item:
+            source_id, address = item.split('=', 1)
+        else:
+            source_id, address = str(index), item
+        source_id, address = source_id.strip(), address.strip()
+        if not address:
+            continue
+        if address.startswith(('ws://', 'wss://')):
+            uri = address
+        elif address.count(':') == 1 and address.rpartition(':')[2].isdigit():
+            uri = f"ws://{address}"
+        else:
+            uri = f"ws://{address}:{port}"
+        sources.append((source_id, uri))
+    return sources
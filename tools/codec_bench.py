@@ -0,0 +1,103 @@
+"""上游解码和推送帧编码的微基准，按帧类型报告每秒处理条数
+
+解码对比标准库 json.loads 与 codec.decode_frame（纯数字快速路径 + 各个已安装的 JSON 库），
+编码对比 json.dumps + datetime.isoformat() 与 codec.heart_rate_frame 模板：
+
+    python tools/codec_bench.py
+    python tools/codec_bench.py --number 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from rolling import RollingStats  # noqa: E402
+
+DECODE_FRAMES = [
+    ('纯整数', '72'),
+    ('纯小数', '72.5'),
+    ('heart_rate', json.dumps({"type": "heart_rate", "value": 72, "unit": "bpm"})),
+    ('heart_rate+rr', json.dumps({"type": "heart_rate", "value": 72, "unit": "bpm", "rr": [833, 841]})),
+    ('heartbeat', json.dumps({"type": "heartbeat"})),
+    ('ack', json.dumps({"type": "ack", "message": "connected"})),
+]
+
+
+def sample_stats():
+    stats = RollingStats()
+    for i in range(600):
+        stats.add(70 + i % 30, i * 0.5)
+    return stats.snapshot()
+
+
+def rate(function, argument, number, repeat):
+    """取多次中最快的一次，返回每秒条数"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function(argument)
+        best = min(best, time.perf_counter() - started)
+    return number / best
+
+
+def available_backends():
+    backends = []
+    for name in codec.BACKENDS:
+        selected = codec.select_backend(name)
+        if selected[0] == name:
+            backends.append(selected)
+    return backends
+
+
+def print_table(title, columns, rows):
+    print(f"\n{title}（条/秒）")
+    print(f"{'帧类型':<16}" + "".join(f"{name:>14}" for name in columns))
+    for name, values in rows:
+        print(f"{name:<16}" + "".join(f"{value:>14,.0f}" for value in values))
+
+
+def main(args):
+    backends = available_backends()
+    print(f"已安装的 JSON 库：{', '.join(name for name, _, _ in backends)}；"
+          f"当前使用 {codec.BACKEND}")
+
+    decoders = [('json.loads', json.loads)]
+    decoders += [(f"decode/{name}", codec.make_decoder(loads)) for name, loads, _ in backends]
+    rows = [(shape, [rate(decode, frame, args.number, args.repeat) for _, decode in decoders])
+            for shape, frame in DECODE_FRAMES]
+    print_table("解码", [name for name, _ in decoders], rows)
+
+    stats = sample_stats()
+    shapes = [
+        ('心率', 72, None),
+        ('心率+rr', 72, {"rr": [833.0, 841.0], "rmssd": 31.2}),
+        ('心率+统计', 72, {"stats": stats, "rr": [833.0, 841.0], "rmssd": 31.2}),
+    ]
+
+    def baseline(shape):
+        _, value, extra = shape
+        payload = {"type": "heart_rate", "current": value, "timestamp": datetime.now().isoformat()}
+        if extra:
+            payload.update(extra)
+        return json.dumps(payload)
+
+    encoders = [('json.dumps', baseline)]
+    for name, _, dumps in backends:
+        encoders.append((f"模板/{name}",
+                         lambda shape, dumps=dumps: codec.heart_rate_frame(shape[1], shape[2], dumps)))
+    rows = [(shape[0], [rate(encode, shape, args.number, args.repeat) for _, encode in encoders])
+            for shape in shapes]
+    print_table("编码", [name for name, _ in encoders], rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="解码和编码的微基准")
+    parser.add_argument('--number', type=int, default=100000, help='每项测试的条数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    main(parser.parse_args())
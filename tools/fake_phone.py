@@ -0,0 +1,157 @@
+"""本地模拟手机心率服务（端口 6667 同款协议）
+
+不需要真机即可测试 HeartRateClient，发送速率可从 1 条/秒到每秒数千条：
+
+    python tools/fake_phone.py --rate 1
+    python tools/fake_phone.py --rate 5000 --mix heart_rate=8,number=1,heartbeat=1
+    python tools/fake_phone.py --rate 2 --rr --glitch 0.05
+
+--rr 在心率消息里附带 RR 间期，--glitch 按比例混入 0、255 这类传感器脱落时的异常值。
+
+每秒打印一次实际发送速率和本进程每条消息的 CPU 时间。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import websockets
+
+MESSAGE_KINDS = ('heart_rate', 'number', 'heartbeat', 'ack')
+
+
+def parse_mix(text):
+    """解析消息比例，如 heart_rate=8,number=1,heartbeat=1"""
+    weights = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in MESSAGE_KINDS:
+            raise argparse.ArgumentTypeError(f"未知的消息类型：{kind}")
+        weights[kind] = float(weight or 1)
+    if not weights:
+        raise argparse.ArgumentTypeError("消息比例不能为空")
+    return weights
+
+
+def build_messages(mix, count=4096, base_bpm=75, seed=0, rr=False, glitch=0.0):
+    """预先生成一批消息，发送时循环使用，避免发送路径上的编码开销"""
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    bpm = float(base_bpm)
+    messages = []
+    for kind in rng.choices(kinds, weights, k=count):
+        # 心率做有界随机游走，看起来像真实数据
+        bpm = min(180.0, max(45.0, bpm + rng.uniform(-2, 2)))
+        if kind == 'heart_rate':
+            message = {"type": "heart_rate", "value": round(bpm), "unit": "bpm"}
+            if rr:
+                # 每条消息带一到两个心跳间期，围绕当前心率有少量逐拍变化
+                message["rr"] = [round(60000 / bpm + rng.gauss(0, 25))
+                                 for _ in range(rng.choice((1, 2)))]
+            if rng.random() < glitch:
+                message["value"] = rng.choice((0, 255))
+            messages.append(json.dumps(message))
+        elif kind == 'number':
+            messages.append(str(round(bpm)))
+        elif kind == 'heartbeat':
+            messages.append(json.dumps({"type": "heartbeat"}))
+        else:
+            messages.append(json.dumps({"type": "ack", "message": "ok"}))
+    return messages
+
+
+class FakePhone:
+    def __init__(self, rate, messages):
+        self.rate = rate
+        self.messages = messages
+        self.sent = 0
+        self.clients = 0
+
+    async def handler(self, websocket):
+        self.clients += 1
+        print(f"[模拟手机] 客户端连接，当前 {self.clients} 个")
+        await websocket.send(json.dumps({"type": "ack", "message": "connected"}))
+        reader = asyncio.create_task(self.read_loop(websocket))
+        try:
+            await self.send_loop(websocket)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            reader.cancel()
+            self.clients -= 1
+            print(f"[模拟手机] 客户端断开，当前 {self.clients} 个")
+
+    async def read_loop(self, websocket):
+        """回应客户端心跳"""
+        try:
+            async for message in websocket:
+                try:
+                    if json.loads(message).get('type') == 'heartbeat':
+                        await websocket.send(json.dumps({"type": "heartbeat"}))
+                except (ValueError, AttributeError):
+                    pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send_loop(self, websocket):
+        """按目标速率发送，每个时间片把到期的消息一次性发出"""
+        loop = asyncio.get_running_loop()
+        messages, total = self.messages, len(self.messages)
+        start = loop.time()
+        index = 0
+        while True:
+            due = int((loop.time() - start) * self.rate) + 1
+            while index < due:
+                await websocket.send(messages[index % total])
+                index += 1
+                self.sent += 1
+            next_at = start + index / self.rate
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+    async def report_loop(self, interval=1.0):
+        last_sent, last_cpu, last_wall = 0, time.process_time(), time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            sent, cpu, wall = self.sent, time.process_time(), time.perf_counter()
+            delta = sent - last_sent
+            per_message = (cpu - last_cpu) / delta * 1e6 if delta else 0.0
+            print(f"[模拟手机] {delta / (wall - last_wall):.0f} 条/秒，"
+                  f"CPU {per_message:.1f} µs/条，累计 {sent} 条")
+            last_sent, last_cpu, last_wall = sent, cpu, wall
+
+
+async def main(args):
+    phone = FakePhone(args.rate, build_messages(
+        args.mix, base_bpm=args.bpm, seed=args.seed, rr=args.rr, glitch=args.glitch))
+    async with websockets.serve(phone.handler, args.host, args.port, compression=None):
+        print(f"[模拟手机] 已启动：ws://{args.host}:{args.port}，目标 {args.rate:g} 条/秒")
+        reporter = asyncio.create_task(phone.report_loop())
+        try:
+            if args.duration:
+                await asyncio.sleep(args.duration)
+            else:
+                await asyncio.Future()
+        finally:
+            reporter.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟手机心率服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--rate', type=float, default=1.0, help='每秒发送的消息数')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('heart_rate=1'),
+                        help='消息类型比例，可选 heart_rate/number/heartbeat/ack')
+    parser.add_argument('--bpm', type=float, default=75, help='心率基准值')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，保证每次数据相同')
+    parser.add_argument('--rr', action='store_true', help='心率消息附带 RR 间期（毫秒）')
+    parser.add_argument('--glitch', type=float, default=0.0, help='混入异常心率值的比例，如 0.05')
+    parser.add_argument('--duration', type=float, default=0, help='运行秒数，0 为一直运行')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        print("\n[模拟手机] 已停止")
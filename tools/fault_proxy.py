@@ -0,0 +1,322 @@
+"""故障注入代理：测量上游断线后的发现用时和恢复用时
+
+代理监听一个端口，把 TCP 流量原样转发给上游（真机或 tools/fake_phone.py），
+并按计划注入故障：
+
+    latency=毫秒    每个数据块延迟转发
+    stall           暂停转发（数据积压在内核缓冲区），到时后一并送达
+    half_open       现有连接变成半开：两个方向的数据都被丢弃，也不关闭，新连接正常
+    reset           立即用 RST 断开所有现有连接
+    slow_read=字节/秒  限制上游到客户端方向的读取速度
+
+同时以网页观众身份连接 /ws，记录每一帧心率的到达时间。运行结束后对每个故障报告：
+    发现    被影响的连接从故障开始到被关闭的用时（客户端发现了死链）
+    重连    故障开始后第一个转发了数据的新连接建立的用时（不计重连前的端口探测）
+    断流    故障期间网页观众收到的两帧之间的最长间隔，以及恢复推送的时刻
+
+half_open、reset 和长于判定上限的 stall 必须在 --detect-bound 秒内被发现，
+否则视为保活（ping_interval/ping_timeout 与 heartbeat_loop）没有起作用，退出码为 1。
+
+    python tools/fake_phone.py --rate 2
+    python tools/fault_proxy.py --listen 6668 --upstream 127.0.0.1:6667
+    python 命令行版本.py            # 输入 ws://127.0.0.1:6668
+
+计划格式为 开始秒:故障[=参数][:持续秒]，逗号分隔，例如
+    --schedule 15:latency=800:10,40:stall:5,60:half_open,130:reset,160:slow_read=32:15
+"""
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import sys
+import time
+
+import aiohttp
+
+ACCESS_CODE = 'XPH5qChgcd'
+FAULTS = ('latency', 'stall', 'half_open', 'reset', 'slow_read')
+DEFAULT_SCHEDULE = '15:latency=800:10,40:stall:5,60:half_open,130:reset,160:slow_read=32:15'
+
+
+class FaultEvent:
+    def __init__(self, at, kind, param=None, duration=0.0):
+        self.at = at
+        self.kind = kind
+        self.param = param
+        self.duration = duration
+        self.started = None  # 实际开始的 monotonic 时间
+        self.affected = []  # 故障开始时仍在的连接
+
+    def __str__(self):
+        text = self.kind if self.param is None else f"{self.kind}={self.param:g}"
+        return f"{text}:{self.duration:g}s" if self.duration else text
+
+
+def parse_schedule(text):
+    """解析故障计划，如 15:latency=800:10,60:half_open"""
+    events = []
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        parts = item.strip().split(':')
+        if len(parts) not in (2, 3):
+            raise argparse.ArgumentTypeError(f"无法解析的故障：{item}")
+        kind, _, param = parts[1].partition('=')
+        if kind not in FAULTS:
+            raise argparse.ArgumentTypeError(f"未知的故障类型：{kind}")
+        try:
+            events.append(FaultEvent(float(parts[0]), kind,
+                                     float(param) if param else None,
+                                     float(parts[2]) if len(parts) == 3 else 0.0))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无法解析的故障：{item}")
+    return sorted(events, key=lambda event: event.at)
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class Link:
+    """一条经过代理的 TCP 连接"""
+
+    def __init__(self, number, client_writer):
+        self.number = number
+        self.client_writer = client_writer
+        self.upstream_writer = None
+        self.opened = time.monotonic()
+        self.closed = None
+        self.forwarded = 0  # 送到客户端的字节数，用来区分真正的连接和端口探测
+        self.blackholed = False
+
+    def abort(self):
+        """SO_LINGER=0 后关闭，对端收到 RST 而不是 FIN"""
+        for writer in (self.client_writer, self.upstream_writer):
+            if writer is None:
+                continue
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                except OSError:
+                    pass
+            writer.transport.abort()
+
+
+class FaultProxy:
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.links = []
+        self.latency = 0.0
+        self.read_rate = 0  # 字节/秒，0 为不限速
+        self.flowing = asyncio.Event()
+        self.flowing.set()
+
+    async def handle(self, client_reader, client_writer):
+        link = Link(len(self.links) + 1, client_writer)
+        self.links.append(link)
+        print(f"[代理] 连接 #{link.number} 建立")
+        try:
+            upstream_reader, link.upstream_writer = await asyncio.open_connection(*self.upstream)
+        except OSError as e:
+            print(f"[代理] 连接 #{link.number} 无法连接上游：{e}")
+            link.closed = time.monotonic()
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self.pump(link, client_reader, link.upstream_writer, downstream=False),
+            self.pump(link, upstream_reader, client_writer, downstream=True),
+            return_exceptions=True)
+        if link.closed is None:
+            link.closed = time.monotonic()
+        for writer in (client_writer, link.upstream_writer):
+            writer.close()
+        print(f"[代理] 连接 #{link.number} 关闭，存活 {link.closed - link.opened:.1f} 秒")
+
+    async def pump(self, link, reader, writer, downstream):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if downstream and self.read_rate:
+                    chunk = max(1, int(self.read_rate / 10))
+                    data = await reader.read(chunk)
+                    await asyncio.sleep(len(data) / self.read_rate)
+                else:
+                    data = await reader.read(65536)
+                if not data:
+                    break
+                # 半开连接照常读取，这样客户端放弃连接时仍能看到 EOF
+                if link.blackholed:
+                    continue
+                await self.flowing.wait()
+                if self.latency:
+                    # 延迟相同，call_later 按先后顺序触发，字节顺序不变
+                    loop.call_later(self.latency, self._write, writer, data)
+                else:
+                    writer.write(data)
+                    await writer.drain()
+                if downstream:
+                    link.forwarded += len(data)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if link.closed is None:
+                link.closed = time.monotonic()
+            writer.close()
+
+    @staticmethod
+    def _write(writer, data):
+        if not writer.is_closing():
+            writer.write(data)
+
+    def open_links(self):
+        return [link for link in self.links if link.closed is None]
+
+    def start_fault(self, event):
+        event.started = time.monotonic()
+        event.affected = self.open_links()
+        print(f"[故障] 开始：{event}，影响 {len(event.affected)} 个连接")
+        if event.kind == 'latency':
+            self.latency = (event.param or 500) / 1000
+        elif event.kind == 'stall':
+            self.flowing.clear()
+        elif event.kind == 'half_open':
+            for link in event.affected:
+                link.blackholed = True
+        elif event.kind == 'reset':
+            for link in event.affected:
+                link.abort()
+        elif event.kind == 'slow_read':
+            self.read_rate = event.param or 64
+
+    def end_fault(self, event):
+        print(f"[故障] 结束：{event}")
+        if event.kind == 'latency':
+            self.latency = 0.0
+        elif event.kind == 'stall':
+            self.flowing.set()
+        elif event.kind == 'slow_read':
+            self.read_rate = 0
+
+
+async def watch_viewer(url, frames):
+    """以网页观众身份接收心率帧，记录到达时间；服务未启动或断开时自动重试"""
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.ws_connect(url, heartbeat=None) as ws:
+                    await ws.send_str(json.dumps({"type": "auth", "code": ACCESS_CODE}))
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT and '"heart_rate"' in msg.data:
+                            frames.append(time.monotonic())
+            except (aiohttp.ClientError, OSError):
+                pass
+            await asyncio.sleep(0.5)
+
+
+async def run_schedule(proxy, events, started):
+    for event in events:
+        await asyncio.sleep(max(0.0, started + event.at - time.monotonic()))
+        proxy.start_fault(event)
+        if event.duration:
+            asyncio.get_running_loop().call_later(event.duration, proxy.end_fault, event)
+
+
+def longest_gap(frames, since, until):
+    """[since, until] 内最长的两帧间隔，返回 (间隔秒数, 恢复推送的时刻)"""
+    window = [t for t in frames if since <= t <= until]
+    before = [t for t in frames if t < since]
+    if before:
+        window.insert(0, before[-1])
+    gap, resumed = 0.0, None
+    for previous, current in zip(window, window[1:]):
+        if current - previous > gap:
+            gap, resumed = current - previous, current
+    if window and until - window[-1] > gap:
+        gap, resumed = until - window[-1], None
+    return gap, resumed
+
+
+def must_detect(event, bound):
+    """这个故障是否应该让客户端放弃现有连接"""
+    return event.kind in ('half_open', 'reset') or (event.kind == 'stall' and event.duration > bound)
+
+
+def report(proxy, events, frames, finished, bound):
+    print()
+    print(f"{'故障':<22} {'影响':>4} {'发现 s':>8} {'重连 s':>8} {'最长断流 s':>10} {'恢复 s':>8}  判定")
+    failures = 0
+    for index, event in enumerate(events):
+        if event.started is None:
+            continue
+        t0 = event.started
+        until = events[index + 1].started if index + 1 < len(events) and events[index + 1].started else finished
+        closed = [link.closed - t0 for link in event.affected if link.closed is not None and link.closed <= until]
+        detect = max(closed) if closed and len(closed) == len(event.affected) else None
+        new_links = [link.opened - t0 for link in proxy.links
+                     if t0 < link.opened <= until and link.forwarded]
+        reconnect = min(new_links) if new_links else None
+        gap, resumed = longest_gap(frames, t0, until)
+
+        verdict = ''
+        if must_detect(event, bound) and event.affected:
+            ok = detect is not None and detect <= bound
+            failures += not ok
+            verdict = '✓' if ok else f'✗ 超过 {bound:g} 秒未发现'
+
+        def show(value):
+            return f"{value:.2f}" if value is not None else '-'
+
+        print(f"{str(event):<22} {len(event.affected):>4} {show(detect):>8} {show(reconnect):>8} "
+              f"{gap:>10.2f} {show(resumed - t0 if resumed else None):>8}  {verdict}")
+    print(f"\n网页观众共收到 {len(frames)} 帧心率")
+    return failures
+
+
+async def main(args):
+    proxy = FaultProxy(args.upstream)
+    server = await asyncio.start_server(proxy.handle, args.host, args.listen)
+    print(f"[代理] {args.host}:{args.listen} → {args.upstream[0]}:{args.upstream[1]}")
+    print(f"[代理] 让 HeartRateClient 连接 ws://{args.host}:{args.listen}")
+
+    frames = []
+    url = f"http://{args.web}/ws" + (f"?source={args.source}" if args.source else "")
+    viewer = asyncio.create_task(watch_viewer(url, frames))
+    started = time.monotonic()
+    schedule = asyncio.create_task(run_schedule(proxy, args.schedule, started))
+    duration = args.duration or (max((e.at + e.duration for e in args.schedule), default=0) + args.settle)
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        finished = time.monotonic()
+        for task in (viewer, schedule):
+            task.cancel()
+        server.close()
+        for link in proxy.open_links():
+            link.abort()
+        # 让各连接的转发任务处理完断开再退出
+        await asyncio.sleep(0.1)
+    return report(proxy, args.schedule, frames, finished, args.detect_bound)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="上游故障注入代理，测量重连恢复用时")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--listen', type=int, default=6668, help='代理监听端口')
+    parser.add_argument('--upstream', type=parse_address, default=('127.0.0.1', 6667),
+                        help='上游地址，如 192.168.3.168:6667')
+    parser.add_argument('--web', default='127.0.0.1:20888', help='心率程序的网页服务地址')
+    parser.add_argument('--source', help='观察的来源 id，默认观察默认来源')
+    parser.add_argument('--schedule', type=parse_schedule, default=parse_schedule(DEFAULT_SCHEDULE),
+                        help='故障计划：开始秒:故障[=参数][:持续秒]，逗号分隔')
+    parser.add_argument('--settle', type=float, default=70,
+                        help='最后一个故障结束后继续观察的秒数')
+    parser.add_argument('--duration', type=float, default=0, help='总运行秒数，0 为按计划自动计算')
+    parser.add_argument('--detect-bound', type=float, default=55,
+                        help='死链必须在多少秒内被发现（ping_interval + ping_timeout + close_timeout 再留余量）')
+    try:
+        sys.exit(1 if asyncio.run(main(parser.parse_args())) else 0)
+    except KeyboardInterrupt:
+        pass
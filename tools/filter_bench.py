@@ -0,0 +1,102 @@
+"""处理级各滤波器的单样本耗时基准
+
+用带异常值和 RR 间期的模拟心率序列，分别测量每个滤波器单独处理一个样本的耗时，
+再测量完整的 SignalProcessor。窗口越大耗时是否基本不变，可以用 --window 验证：
+
+    python tools/filter_bench.py
+    python tools/filter_bench.py --samples 500000 --window 7 31 101
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import EmaFilter, MedianOutlierFilter, RRAnalyzer, SignalProcessor  # noqa: E402
+
+
+def make_samples(count, glitch, seed=0):
+    """返回 [(心率, RR 间期列表)]，心率做有界随机游走并按比例混入 0、255"""
+    rng = random.Random(seed)
+    bpm = 75.0
+    samples = []
+    for _ in range(count):
+        bpm = min(180.0, max(45.0, bpm + rng.uniform(-2, 2)))
+        value = rng.choice((0, 255)) if rng.random() < glitch else round(bpm)
+        samples.append((value, [60000 / bpm + rng.gauss(0, 25)]))
+    return samples
+
+
+def per_sample_ns(step, samples, repeat):
+    """step 处理全部样本，取多次中最快的一次，换算成每个样本的纳秒数"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        step(samples)
+        best = min(best, time.perf_counter() - started)
+    return best / len(samples) * 1e9
+
+
+def bench_baseline(samples):
+    for value, rr in samples:
+        pass
+
+
+def bench_median(window):
+    def run(samples):
+        check = MedianOutlierFilter(window).check
+        for value, rr in samples:
+            check(value)
+    return run
+
+
+def bench_ema(samples):
+    update = EmaFilter(2.0).update
+    for index, (value, rr) in enumerate(samples):
+        update(value, index * 0.5)
+
+
+def bench_rr(window):
+    def run(samples):
+        add = RRAnalyzer(window).add
+        for value, rr in samples:
+            add(rr[0])
+    return run
+
+
+def bench_processor(window):
+    def run(samples):
+        process = SignalProcessor(median_window=window, smoothing=2.0, hrv_window=window).process
+        for index, (value, rr) in enumerate(samples):
+            process(value, rr, index * 0.5)
+    return run
+
+
+def main(args):
+    samples = make_samples(args.samples, args.glitch)
+    print(f"样本数 {args.samples}，异常值比例 {args.glitch:g}，取 {args.repeat} 次中最快的一次\n")
+    baseline = per_sample_ns(bench_baseline, samples, args.repeat)
+    print(f"{'空循环':<24}{baseline:8.1f} ns/样本（以下均已扣除）")
+    print(f"{'EMA 平滑':<22}{per_sample_ns(bench_ema, samples, args.repeat) - baseline:8.1f} ns/样本")
+    for window in args.window:
+        print(f"\n窗口 {window}：")
+        rows = [
+            ('中位数异常值剔除', bench_median(window)),
+            ('RR 间期 RMSSD', bench_rr(window)),
+            ('完整处理级', bench_processor(window)),
+        ]
+        for name, step in rows:
+            cost = per_sample_ns(step, samples, args.repeat) - baseline
+            print(f"  {name:<20}{cost:8.1f} ns/样本")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="处理级各滤波器的单样本耗时")
+    parser.add_argument('--samples', type=int, default=200000, help='模拟样本数')
+    parser.add_argument('--glitch', type=float, default=0.02, help='异常值比例')
+    parser.add_argument('--window', type=int, nargs='+', default=[7, 31],
+                        help='中位数和 RMSSD 的窗口大小，可给多个')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数')
+    main(parser.parse_args())
@@ -0,0 +1,132 @@
+"""核对离线分析的 RMSSD 与实时推送的 RMSSD 是否一致
+
+实时推送的 RMSSD 由 filters.RRAnalyzer 按最近 --hrv-window 个差值计算，
+离线分析（analytics）对整段录制一次性计算，报告中的“结束时 RMSSD”取最后同样多个差值。
+本工具把录制文件里的 RR 间期逐个送入 RRAnalyzer，与 numpy 和纯 Python 两种分析结果对比：
+
+    python tools/hrv_check.py 录制目录 [--hrv-window 30]
+
+不给路径时先模拟一段带异常值的会话：样本经过完整的 SignalProcessor，
+通过的样本像实时推送那样录制下来，再用处理级结束时的 RMSSD 核对离线结果。
+任一来源相差超过 --tolerance（相对误差）时退出码为 1。
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+from filters import RRAnalyzer, SignalProcessor  # noqa: E402
+from recorder import SessionReader, SessionRecorder, iter_samples  # noqa: E402
+from replay import group_by_source  # noqa: E402
+
+
+def simulate(directory, count, glitch, window, seed=0):
+    """处理并录制一段模拟会话，返回处理级结束时的 RMSSD"""
+    rng = random.Random(seed)
+    processor = SignalProcessor(hrv_window=window)
+    recorder = SessionRecorder(directory, log=lambda *args: None)
+    os.makedirs(directory, exist_ok=True)
+    bpm = 75.0
+    for i in range(count):
+        bpm = min(180.0, max(45.0, bpm + rng.uniform(-2, 2)))
+        value = rng.choice((0, 255)) if rng.random() < glitch else round(bpm)
+        rr = [round(60000 / bpm + rng.gauss(0, 25)) for _ in range(rng.choice((1, 2)))]
+        reading = processor.process(value, rr, timestamp=i * 0.5)
+        if reading is not None:
+            # 与 HeartRateService.broadcast 相同：只录制通过滤波的样本
+            recorder.record('sim', float(reading.value), reading.rr, timestamp=1.7e9 + i * 0.5)
+    asyncio.run(recorder.close())
+    return processor.rr.rmssd
+
+
+def replay_rmssd(files, window):
+    """按录制顺序把 RR 间期送入实时使用的 RRAnalyzer，返回 (最近 window 个差值, 全部差值) 的 RMSSD"""
+    recent = RRAnalyzer(window)
+    whole = RRAnalyzer(math.inf)
+    for path in files:
+        with SessionReader(path) as reader:
+            for _, _, rr in iter_samples(reader.iter_records()):
+                for interval in rr:
+                    recent.add(interval)
+                    whole.add(interval)
+    return recent.rmssd, whole.rmssd
+
+
+def offline_results(paths, window):
+    """返回 {后端: {来源: hrv}}，装了 numpy 时两种实现都算一遍"""
+    options = analytics.AnalysisOptions(hrv_window=window)
+    load_numpy = analytics.load_numpy
+    backends = {}
+    try:
+        if load_numpy() is not None:
+            results = analytics.analyze(paths, options, log=lambda *args: None)
+            backends['numpy'] = {source: s['hrv'] for source, s in results.items()}
+        analytics.load_numpy = lambda: None
+        results = analytics.analyze(paths, options, log=lambda *args: None)
+        backends['python'] = {source: s['hrv'] for source, s in results.items()}
+    finally:
+        analytics.load_numpy = load_numpy
+    return backends
+
+
+def close(a, b, tolerance):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=tolerance, abs_tol=1e-9)
+
+
+def shown(value):
+    return "无" if value is None else f"{value:.4f}"
+
+
+def check(paths, window, tolerance, live=None):
+    groups = group_by_source(paths)
+    if not groups:
+        print("[错误] 没有找到录制文件")
+        return 1
+    offline = offline_results(paths, window)
+    failures = 0
+    for source, files in groups.items():
+        recent, whole = replay_rmssd(files, window)
+        expected = [('逐个送入 RRAnalyzer', 'rmssd_recent', recent), ('全部差值', 'rmssd', whole)]
+        if live is not None:
+            expected.insert(0, ('实时处理级', 'rmssd_recent', live))
+        print(f"来源 {source}：")
+        for backend, results in offline.items():
+            hrv = results.get(source)
+            for name, key, value in expected:
+                got = hrv[key] if hrv else None
+                ok = close(got, value, tolerance)
+                failures += not ok
+                print(f"  {'✓' if ok else '✗'} {backend:<7}{key:<14}{shown(got):>10}  "
+                      f"{name} {shown(value)}")
+    if failures:
+        print(f"\n[✗] {failures} 项不一致")
+        return 1
+    print("\n[✓] 离线 RMSSD 与实时计算一致")
+    return 0
+
+
+def main(args):
+    if args.paths:
+        return check(args.paths, args.hrv_window, args.tolerance)
+    with tempfile.TemporaryDirectory() as directory:
+        live = simulate(directory, args.samples, args.glitch, args.hrv_window)
+        print(f"模拟会话：{args.samples} 个样本，异常值比例 {args.glitch:g}\n")
+        return check([directory], args.hrv_window, args.tolerance, live)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="核对离线分析与实时推送的 RMSSD")
+    parser.add_argument('paths', nargs='*', metavar='路径', help='录制文件或目录，不给则模拟一段会话')
+    parser.add_argument('--hrv-window', type=int, default=30, help='实时 RMSSD 的 RR 差值个数')
+    parser.add_argument('--samples', type=int, default=2000, help='模拟会话的样本数')
+    parser.add_argument('--glitch', type=float, default=0.02, help='模拟会话的异常值比例')
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='允许的相对误差')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,180 @@
+"""网页端 /ws 压测：模拟大量 OBS/浏览器观众
+
+按阶梯逐步增加并发观众数，每个观众像网页脚本一样先发送 auth，
+然后给每一帧 heart_rate 打时间戳。每个阶梯结束时报告推送延迟
+p50/p99/最大值、每秒收到的消息数，以及服务端进程的 RSS 和 CPU。
+
+延迟由帧里的 timestamp 字段计算，压测工具需要和服务端跑在同一台机器上。
+上游数据可以用 tools/fake_phone.py 或 --replay 回放来产生：
+
+    python tools/load_viewers.py --steps 100,500,1000,2000 --hold 10 --pid <服务端进程号>
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import aiohttp
+
+ACCESS_CODE = 'XPH5qChgcd'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ProcessSampler:
+    """从 /proc 读取进程的 RSS 和累计 CPU 时间（仅 Linux）"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.last = None
+
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def cpu_seconds(self):
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                # 进程名可能带空格，从最后一个右括号之后开始切分
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except (OSError, IndexError, ValueError):
+            return 0.0
+
+    def cpu_percent(self):
+        """距上次调用期间的 CPU 占用百分比"""
+        now = (time.perf_counter(), self.cpu_seconds())
+        last, self.last = self.last, now
+        if last is None or now[0] <= last[0]:
+            return 0.0
+        return (now[1] - last[1]) / (now[0] - last[0]) * 100
+
+
+class Viewer:
+    def __init__(self, stats):
+        self.stats = stats
+        self.task = None
+
+    async def run(self, session, url, ready):
+        try:
+            async with session.ws_connect(url, heartbeat=None) as ws:
+                await ws.send_str(json.dumps({"type": "auth", "code": ACCESS_CODE}))
+                self.stats.connected += 1
+                ready.set_result(True)
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    received = datetime.now()
+                    data = json.loads(msg.data)
+                    if data.get('type') == 'heart_rate':
+                        sent = datetime.fromisoformat(data['timestamp'])
+                        self.stats.latencies.append((received - sent).total_seconds() * 1000)
+                        self.stats.frames += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.stats.errors += 1
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            if not ready.done():
+                ready.set_result(False)
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.errors = 0
+        self.frames = 0
+        self.latencies = []
+
+    def reset_window(self):
+        self.frames = 0
+        self.latencies = []
+
+
+def raise_fd_limit():
+    """尽量提高文件描述符上限，数千个连接需要"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+async def main(args):
+    raise_fd_limit()
+    params = {'source': args.source, 'rate': args.rate, 'changes': '1' if args.changes else None}
+    query = "&".join(f"{key}={value:g}" if isinstance(value, float) else f"{key}={value}"
+                     for key, value in params.items() if value)
+    url = f"http://{args.host}:{args.port}/ws" + (f"?{query}" if query else "")
+    sampler = ProcessSampler(args.pid) if args.pid else None
+    stats = Stats()
+    viewers = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        print(f"{'观众数':>6} {'连接失败':>8} {'消息/秒':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'最大 ms':>8} {'RSS MB':>8} {'CPU %':>6}")
+        for target in args.steps:
+            while len(viewers) < target:
+                batch = []
+                for _ in range(min(args.connect_batch, target - len(viewers))):
+                    viewer = Viewer(stats)
+                    ready = asyncio.get_running_loop().create_future()
+                    viewer.task = asyncio.create_task(viewer.run(session, url, ready))
+                    viewers.append(viewer)
+                    batch.append(ready)
+                await asyncio.gather(*batch, return_exceptions=True)
+
+            if sampler:
+                sampler.cpu_percent()
+            stats.reset_window()
+            started = time.perf_counter()
+            await asyncio.sleep(args.hold)
+            elapsed = time.perf_counter() - started
+
+            latencies = sorted(stats.latencies)
+            rss = sampler.rss_mb() if sampler else 0.0
+            cpu = sampler.cpu_percent() if sampler else 0.0
+            print(f"{target:>6} {stats.errors:>8} {stats.frames / elapsed:>10.0f} "
+                  f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+                  f"{(latencies[-1] if latencies else 0.0):>8.2f} {rss:>8.1f} {cpu:>6.1f}")
+
+        for viewer in viewers:
+            viewer.task.cancel()
+        await asyncio.gather(*(viewer.task for viewer in viewers), return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="网页端 /ws 并发观众压测")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=20888)
+    parser.add_argument('--source', help='订阅的来源 id，默认订阅默认来源')
+    parser.add_argument('--rate', type=float, help='每个观众订阅的最大推送频率（条/秒）')
+    parser.add_argument('--changes', action='store_true', help='只订阅数值变化的帧')
+    parser.add_argument('--steps', default='10,100,500,1000',
+                        type=lambda text: [int(n) for n in text.split(',') if n.strip()],
+                        help='逐级增加到的观众数，逗号分隔')
+    parser.add_argument('--hold', type=float, default=10, help='每一级的统计时长（秒）')
+    parser.add_argument('--connect-batch', type=int, default=100, help='每批同时建立的连接数')
+    parser.add_argument('--pid', type=int, help='服务端进程号，用于采集 RSS 和 CPU')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
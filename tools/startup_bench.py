@@ -0,0 +1,176 @@
+"""启动耗时基准：从启动进程到网页收到第一帧心率
+
+每一轮都启动一个全新的命令行版本进程（冷启动），通过标准输入给出上游地址，
+同时以网页观众身份不断尝试连接 /ws，记录：
+    --help    只解析参数就退出的耗时，即导入全部模块的开销
+    网页就绪  第一次成功连上 /ws 的时刻
+    首次推送  收到第一帧心率的时刻（新观众会立即收到最新值，误差在几毫秒内）
+
+上游默认由本工具启动的 tools/fake_phone.py 提供。--importtime 列出导入最慢的模块，
+--budget-ms 设定首次推送的上限，中位数超出时退出码为 1，可用于在低配的 Linux 中继机上做回归检查。
+20888 端口已被占用（如残留的实例）时直接退出，否则测到的是旧实例的响应：
+
+    python tools/startup_bench.py --runs 10 --importtime 10 --budget-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from discovery import port_open  # noqa: E402
+
+CLI = os.path.join(ROOT, '命令行版本.py')
+ACCESS_CODE = 'XPH5qChgcd'
+WEB_PORT = 20888
+WS_URL = f'http://127.0.0.1:{WEB_PORT}/ws'
+
+
+async def wait_port_free(port, timeout):
+    """等待上一轮的进程释放端口，超时返回 False"""
+    deadline = time.perf_counter() + timeout
+    while await port_open('127.0.0.1', port, 0.2):
+        if time.perf_counter() >= deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def time_help():
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, CLI, '--help',
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    await process.wait()
+    return time.perf_counter() - started
+
+
+async def wait_first_frame(session, url, timeout):
+    """反复连接 /ws，返回 (连上的时刻, 收到第一帧心率的时刻)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.ws_connect(url, heartbeat=None) as ws:
+                connected = time.perf_counter()
+                await ws.send_str(json.dumps({"type": "auth", "code": ACCESS_CODE}))
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT and '"heart_rate"' in msg.data:
+                        return connected, time.perf_counter()
+        except (aiohttp.ClientError, OSError):
+            await asyncio.sleep(0.005)
+    return None, None
+
+
+async def time_cold_start(session, upstream, url, timeout):
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, CLI, stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    process.stdin.write(f"{upstream}\n".encode())
+    await process.stdin.drain()
+    try:
+        connected, first_frame = await wait_first_frame(session, url, timeout)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), 10)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    if first_frame is None:
+        return None, None
+    return connected - started, first_frame - started
+
+
+def import_report(top):
+    """用 -X importtime 找出导入最慢的模块（只看前两层，更深的子模块已计入上层）"""
+    import subprocess
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import service, sources, recorder, replay'],
+        cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative_us), '  ' * depth + name.strip()))
+    print(f"\n导入最慢的 {top} 个模块（累计 ms）：")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+
+def summarize(name, values):
+    values = [v * 1000 for v in values if v is not None]
+    if not values:
+        print(f"{name:<10} 无数据")
+        return None
+    median = statistics.median(values)
+    print(f"{name:<10} 最小 {min(values):7.1f} ms   中位 {median:7.1f} ms   最大 {max(values):7.1f} ms")
+    return median
+
+
+async def main(args):
+    if await port_open('127.0.0.1', WEB_PORT, 0.2):
+        print(f"[✗] 端口 {WEB_PORT} 已被占用，请先关闭正在运行的实例")
+        return 1
+    phone = None
+    if not args.upstream:
+        phone = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, 'tools', 'fake_phone.py'),
+            '--port', str(args.phone_port), '--rate', str(args.rate),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        await asyncio.sleep(0.5)
+    upstream = args.upstream or f"127.0.0.1:{args.phone_port}"
+    upstream = upstream if upstream.startswith('ws') else f"ws://{upstream}"
+
+    helps, readies, firsts = [], [], []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for run in range(args.runs):
+                if not await wait_port_free(WEB_PORT, 5):
+                    print(f"[✗] 端口 {WEB_PORT} 未被释放，上一轮的进程可能没有退出")
+                    return 1
+                helps.append(await time_help())
+                ready, first = await time_cold_start(session, upstream, WS_URL, args.timeout)
+                readies.append(ready)
+                firsts.append(first)
+                shown = f"{first * 1000:.1f} ms" if first is not None else "超时"
+                print(f"[{run + 1}/{args.runs}] 首次推送 {shown}")
+    finally:
+        if phone:
+            phone.terminate()
+            await phone.wait()
+
+    print()
+    summarize('--help', helps)
+    summarize('网页就绪', readies)
+    median = summarize('首次推送', firsts)
+    if args.importtime:
+        import_report(args.importtime)
+    if args.budget_ms and (median is None or median > args.budget_ms):
+        print(f"\n[✗] 首次推送中位数超过 {args.budget_ms:g} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="命令行版本冷启动到首次推送的耗时基准")
+    parser.add_argument('--runs', type=int, default=5, help='冷启动次数')
+    parser.add_argument('--upstream', help='上游地址，默认自动启动 fake_phone.py')
+    parser.add_argument('--phone-port', type=int, default=6667)
+    parser.add_argument('--rate', type=float, default=20, help='模拟手机每秒发送的心率条数')
+    parser.add_argument('--timeout', type=float, default=15, help='单次等待第一帧的最长秒数')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='列出导入最慢的 N 个模块')
+    parser.add_argument('--budget-ms', type=float, default=0, help='首次推送中位数的上限，0 为不检查')
+    sys.exit(asyncio.run(main(parser.parse_args())))
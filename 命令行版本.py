@@ -1,482 +1,179 @@
+import argparse
 import asyncio
-import json
-import websockets
 import signal
-from datetime import datetime
-from aiohttp import web
 
-# 全局变量，用于存储最新心率数据
-latest_heart_rate = None
-connected_clients = set()
-is_shutting_down = False  # 新增：标记是否正在关闭
-
-# 网页 HTML 内容
-HTML_CONTENT = '''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>心率显示</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <link rel="stylesheet" href="https://cdn.bootcdn.net/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-    <style>
-        :root {
-            --primary-color: #ff4757;
-            --highlight-color: #ff6b81;
-        }
-        
-        body, html {
-            width: 100%;
-            height: 100%;
-            margin: 0;
-            padding: 0;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            background: transparent;
-        }
-        
-        .container {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            white-space: nowrap;
-        }
-        
-        .heart-icon {
-            display: inline-block;
-            color: var(--primary-color);
-            font-size: 60px;
-            margin-right: 15px;
-            animation: heartbeat 1.5s infinite;
-            vertical-align: middle;
-        }
-        
-        .heart-rate {
-            display: inline-block;
-            font-size: 80px;
-            font-weight: bold;
-            color: var(--highlight-color);
-            text-shadow: 0 0 10px rgba(255, 107, 129, 0.7);
-            vertical-align: middle;
-        }
-        
-        @keyframes heartbeat {
-            0% { transform: scale(1); }
-            25% { transform: scale(1.1); }
-            50% { transform: scale(1); }
-            75% { transform: scale(1.1); }
-            100% { transform: scale(1); }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="heart-icon">
-            <i class="fas fa-heart"></i>
-        </div>
-        <div class="heart-rate" id="currentRate">--</div>
-    </div>
-    
-    <script>
-        const accessCode = 'XPH5qChgcd';
-        let ws = null;
-        
-        function connectWebSocket() {
-            const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-            const host = window.location.host;
-            
-            ws = new WebSocket(`${protocol}${host}/ws`);
-            
-            ws.onopen = function() {
-                ws.send(JSON.stringify({
-                    type: 'auth',
-                    code: accessCode
-                }));
-            };
-            
-            ws.onmessage = function(event) {
-                try {
-                    const data = JSON.parse(event.data);
-                    if (data.type === 'heart_rate') {
-                        updateHeartRate(data.current);
-                    }
-                } catch (e) {
-                    console.error('数据解析错误:', e);
-                }
-            };
-            
-            ws.onclose = function() {
-                setTimeout(connectWebSocket, 3000);
-            };
-            
-            ws.onerror = function(error) {
-                console.error('WebSocket 错误:', error);
-            };
-        }
-        
-        function updateHeartRate(current) {
-            const rateElement = document.getElementById('currentRate');
-            const heartIcon = document.querySelector('.heart-icon i');
-            
-            if (rateElement) {
-                rateElement.textContent = current !== undefined ? current : '--';
-            }
-            
-            if (heartIcon && current !== '--' && !isNaN(current)) {
-                const rate = parseInt(current);
-                const duration = Math.max(0.5, 2 - (rate - 60) / 100);
-                heartIcon.style.animationDuration = `${duration}s`;
-            }
-        }
-        
-        // 初始化连接
-        connectWebSocket();
-    </script>
-</body>
-</html>'''
-
-
-class HeartRateClient:
-    def __init__(self, uri):
-        self.uri = uri
-        self.websocket = None
-        self.reconnect_delay = 5
-        self.max_reconnect_delay = 60
-        self.heartbeat_interval = 15
-        self.is_running = True
-        self.heartbeat_task = None
-        
-    def is_connection_open(self):
-        """安全检查连接是否打开"""
-        if self.websocket is None:
-            return False
-        try:
-            if hasattr(self.websocket, 'closed'):
-                return not self.websocket.closed
-            elif hasattr(self.websocket, 'open'):
-                return self.websocket.open
-            else:
-                return True
-        except AttributeError:
-            return False
-        
-    async def send_heartbeat(self):
-        """发送心跳保持连接"""
-        try:
-            if self.is_connection_open():
-                heartbeat = {
-                    "type": "heartbeat",
-                    "timestamp": datetime.now().isoformat()
-                }
-                await self.websocket.send(json.dumps(heartbeat))
-        except Exception as e:
-            print(f"[心跳失败] {e}")
-    
-    async def heartbeat_loop(self):
-        """心跳循环"""
-        try:
-            while self.is_running and self.is_connection_open():
-                try:
-                    await asyncio.sleep(self.heartbeat_interval)
-                    if self.is_connection_open():
-                        await self.send_heartbeat()
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    print(f"[心跳错误] {e}")
-                    break
-        except asyncio.CancelledError:
-            pass
-        finally:
-            print("[心跳] 心跳循环结束")
-    
-    async def connect(self):
-        """主连接逻辑"""
-        while self.is_running:
-            try:
-                print(f"[*] 尝试连接：{self.uri} (时间：{datetime.now().strftime('%H:%M:%S')})")
-                
-                async with websockets.connect(
-                    self.uri,
-                    ping_interval=20,
-                    ping_timeout=20,
-                    close_timeout=10,
-                    max_size=2**20,
-                    compression=None,
-                ) as websocket:
-                    self.websocket = websocket
-                    self.reconnect_delay = 5
-                    print(f"[✓] 连接成功！(时间：{datetime.now().strftime('%H:%M:%S')})")
-                    
-                    self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
-                    
-                    try:
-                        async for message in websocket:
-                            try:
-                                data = json.loads(message)
-                                
-                                if isinstance(data, dict):
-                                    msg_type = data.get('type', 'unknown')
-                                    
-                                    if msg_type == 'heart_rate':
-                                        value = data.get('value')
-                                        print(f"  ❤️  心率：{value} {data.get('unit', 'bpm')}")
-                                        # 更新全局心率数据并推送给网页
-                                        await broadcast_heart_rate(value)
-                                    elif msg_type == 'heartbeat':
-                                        print(f"  ✓ 心跳响应")
-                                    elif msg_type == 'ack':
-                                        print(f"  ✓ 服务器确认：{data.get('message')}")
-                                    else:
-                                        print(f"  📦 {data}")
-                                elif isinstance(data, (int, float)):
-                                    print(f"  ❤️  心率值：{data} bpm")
-                                    # 更新全局心率数据并推送给网页
-                                    await broadcast_heart_rate(data)
-                                else:
-                                    print(f"  📝 {message}")
-                                    
-                            except json.JSONDecodeError:
-                                print(f"  📝 原始：{message}")
-                                
-                    except websockets.exceptions.ConnectionClosedError as e:
-                        print(f"\n[⚠️] 连接异常断开：{e}")
-                    except websockets.exceptions.ConnectionClosedOK as e:
-                        print(f"\n[✓] 连接正常关闭：{e}")
-                    except asyncio.CancelledError:
-                        print("\n[⚠️] 连接被取消")
-                        break
-                    finally:
-                        if self.heartbeat_task and not self.heartbeat_task.done():
-                            self.heartbeat_task.cancel()
-                            try:
-                                await self.heartbeat_task
-                            except asyncio.CancelledError:
-                                pass
-                        self.heartbeat_task = None
-                        self.websocket = None
-                        
-            except websockets.exceptions.InvalidStatus as e:
-                print(f"[错误] HTTP 状态码：{e.status_code}")
-            except ConnectionRefusedError:
-                print(f"[错误] 连接被拒绝")
-            except OSError as e:
-                print(f"[错误] 网络错误：{e}")
-            except asyncio.CancelledError:
-                print("\n[⚠️] 连接任务被取消")
-                break
-            except KeyboardInterrupt:
-                print("\n[⚠️] 用户中断")
-                break
-            except Exception as e:
-                print(f"[错误] 未知：{type(e).__name__}: {e}")
-            
-            if not self.is_running:
-                print("[*] 停止信号已收到，退出重连循环")
-                break
-                
-            print(f"[*] {self.reconnect_delay}秒后重连... (按 Ctrl+C 停止)")
-            
-            try:
-                for i in range(int(self.reconnect_delay)):
-                    if not self.is_running:
-                        print("[*] 重连被取消")
-                        break
-                    await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                print("\n[⚠️] 重连等待被取消")
-                break
-            except KeyboardInterrupt:
-                print("\n[⚠️] 用户中断重连")
-                break
-                
-            if not self.is_running:
-                break
-            
-            if self.reconnect_delay < self.max_reconnect_delay:
-                self.reconnect_delay = min(self.reconnect_delay * 1.5, self.max_reconnect_delay)
-        
-        print("[*] 连接循环已结束")
-    
-    def stop(self):
-        """停止客户端"""
-        self.is_running = False
-        print("\n[*] 收到停止信号...")
+from analytics import add_analysis_arguments, analysis_options, analyze
+from console import ERROR, LEVELS, ConsoleLogger
+from discovery import discover
+from filters import add_filter_arguments, filter_options
+from recorder import SessionRecorder
+from rolling import DEFAULT_ZONES, parse_zones
+from replay import group_by_source, replay
+from service import HeartRateService
+from sources import parse_sources
 
+# 心率客户端、推送和网页服务都在 service 中，这里只负责命令行交互
+# 日志和逐条心率交给后台线程输出，控制台再慢也不会阻塞事件循环
+log = ConsoleLogger()
+viewer_count = 0  # 由事件循环线程更新，写日志线程只读取这个整数，不碰 service 的数据结构
 
-async def broadcast_heart_rate(value):
-    """广播心率数据到所有连接的网页客户端"""
-    global latest_heart_rate
-    latest_heart_rate = value
-    
-    message = json.dumps({
-        "type": "heart_rate",
-        "current": value,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    # 发送给所有连接的客户端
-    disconnected = set()
-    for ws in connected_clients:
-        try:
-            await ws.send_str(message)
-        except Exception:
-            disconnected.add(ws)
-    
-    # 清理断开的连接
-    connected_clients.difference_update(disconnected)
 
-async def handle_websocket(request):
-    """处理网页 WebSocket 连接"""
-    ws = web.WebSocketResponse()
-    await ws.prepare(request)
-    
-    connected_clients.add(ws)
-    print(f"[🌐] 网页客户端连接，当前连接数：{len(connected_clients)}")
-    
-    # 如果有最新心率数据，立即发送给新连接的客户端
-    if latest_heart_rate is not None:
-        try:
-            await ws.send_str(json.dumps({
-                "type": "heart_rate",
-                "current": latest_heart_rate,
-                "timestamp": datetime.now().isoformat()
-            }))
-        except Exception:
-            pass
-    
-    try:
-        async for msg in ws:
-            if msg.type == web.WSMsgType.TEXT:
-                try:
-                    data = json.loads(msg.data)
-                    if data.get('type') == 'auth':
-                        # 验证访问码
-                        if data.get('code') == 'XPH5qChgcd':
-                            await ws.send_str(json.dumps({
-                                "type": "auth_result",
-                                "success": True
-                            }))
-                            print(f"[🌐] 网页客户端认证成功")
-                        else:
-                            await ws.send_str(json.dumps({
-                                "type": "auth_result",
-                                "success": False,
-                                "message": "访问码错误"
-                            }))
-                            await ws.close()
-                except json.JSONDecodeError:
-                    pass
-            elif msg.type == web.WSMsgType.ERROR:
-                print(f"[🌐] WebSocket 错误：{ws.exception()}")
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        if not is_shutting_down:
-            print(f"[🌐] WebSocket 异常：{e}")
-    finally:
-        connected_clients.discard(ws)
-        if not is_shutting_down:
-            print(f"[🌐] 网页客户端断开，当前连接数：{len(connected_clients)}")
-    
-    return ws
+def on_heart_rate(source, value, stats):
+    global viewer_count
+    viewer_count = len(service.channels)
+    log.sample(source, value)
 
 
-async def handle_index(request):
-    """处理网页请求"""
-    return web.Response(text=HTML_CONTENT, content_type='text/html')
+service = HeartRateService(log=log, on_heart_rate=on_heart_rate)
 
 
-async def start_web_server():
-    """启动网页服务器"""
-    app = web.Application()
-    app.router.add_get('/', handle_index)
-    app.router.add_get('/ws', handle_websocket)
-    
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, '127.0.0.1', 20888)
-    await site.start()
-    
-    print("=" * 60)
-    print("🌐 网页服务已启动")
-    print("📍 访问地址：http://127.0.0.1:20888")
-    print("=" * 60)
-    
-    return runner
+def parse_args():
+    parser = argparse.ArgumentParser(description="WebSocket 心率客户端 + 网页服务")
+    parser.add_argument('--record', metavar='目录',
+                        help='把收到的心率录制到指定目录（二进制格式，按大小或时长轮换文件）')
+    parser.add_argument('--rotate-mb', type=float, default=64, help='录制文件轮换大小，单位 MB')
+    parser.add_argument('--rotate-minutes', type=float, default=60, help='录制文件轮换时长，单位分钟')
+    parser.add_argument('--discover', action='store_true',
+                        help='不询问 IP，直接在局域网内搜索手机')
+    parser.add_argument('--replay', metavar='路径', nargs='+',
+                        help='回放录制文件或目录，代替连接手机')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='回放倍速，1 为实时，0 为不限速（默认 1）')
+    parser.add_argument('--loop', action='store_true', help='回放结束后从头循环')
+    parser.add_argument('--log-level', choices=LEVELS, default='info',
+                        help='日志级别，debug 时逐条输出心率和网页客户端连接（默认 info）')
+    parser.add_argument('--status-interval', type=float, default=1.0, metavar='秒',
+                        help='心率状态行的刷新间隔，0 为不显示')
+    parser.add_argument('--zones', type=parse_zones, default=DEFAULT_ZONES, metavar='60,100,140,170',
+                        help='心率区间边界（bpm），推送数据中统计每个区间的累计时间')
+    add_filter_arguments(parser)
+    add_analysis_arguments(parser)
+    return parser.parse_args()
 
 
-async def main():
-    global is_shutting_down
-    
+async def main(args):
+    service.filters = filter_options(args)
+    service.channels.zones = args.zones
+    log.level = LEVELS[args.log_level]
+    log.status_interval = max(0.0, args.status_interval)
+    log.status = lambda: f"观众 {viewer_count}"
+    log.start()
     # 手动输入 IP 地址
-    print("=" * 60)
-    print("🔗 WebSocket 心率客户端 + 网页服务")
-    print("=" * 60)
+    log("=" * 60)
+    log("🔗 WebSocket 心率客户端 + 网页服务")
+    log("=" * 60)
+    
+    sources = []
+    replay_groups = None
+    if args.replay:
+        # 回放模式：数据来自录制文件，不需要输入 IP
+        replay_groups = group_by_source(args.replay)
+        if not replay_groups:
+            log("[错误] 没有找到录制文件", ERROR)
+            return
+        for source_id, files in replay_groups.items():
+            service.channels.ensure(source_id)
+            log(f"\n[*] 回放来源：{source_id}（{len(files)} 个文件）→ /ws?source={source_id}")
+        speed = "不限速" if args.speed <= 0 else f"{args.speed:g} 倍速"
+        log(f"[*] 回放速度：{speed}")
+    else:
+        # 多个来源用逗号分隔，可写成 名称=IP，端口固定为 6667；直接回车则在局域网内自动搜索
+        while True:
+            if args.discover:
+                text = ""
+            else:
+                log.flush()
+                text = input("\n请输入服务器 IP 地址 (如 192.168.3.168，多个用逗号分隔，直接回车自动搜索): ").strip()
+            if not text:
+                text = ",".join(await discover(log=log))
+                if not text:
+                    args.discover = False
+                    log("[错误] 没有找到手机，请手动输入 IP 地址！", ERROR)
+                    continue
+            sources = parse_sources(text)
+            if sources:
+                break
+            log("[错误] IP 地址不能为空，请重新输入！", ERROR)
+        
+        for source_id, uri in sources:
+            service.channels.ensure(source_id)
+            log(f"\n[*] 目标地址：{uri}" + (f" → /ws?source={source_id}" if len(sources) > 1 else ""))
+    log("[*] 按 Ctrl+C 停止程序\n")
     
-    while True:
-        ip = input("\n请输入服务器 IP 地址 (如 192.168.3.168): ").strip()
-        if ip:
-            break
-        print("[错误] IP 地址不能为空，请重新输入！")
+    # 启动网页服务器
+    url = await service.start_web_server()
+    log("=" * 60)
+    log("🌐 网页服务已启动")
+    log(f"📍 访问地址：{url}")
+    log("=" * 60)
     
-    port = 6667  # 固定端口
-    uri = f"ws://{ip}:{port}"
+    if args.record:
+        service.recorder = SessionRecorder(args.record,
+                                   rotate_bytes=int(args.rotate_mb * 1024 * 1024),
+                                   rotate_seconds=args.rotate_minutes * 60,
+                                   log=log).start()
+        log(f"[*] 心率录制到目录：{args.record}")
     
-    print(f"\n[*] 目标地址：{uri}")
-    print("[*] 按 Ctrl+C 停止程序\n")
+    clients = [service.client(uri, source_id, show_source=len(sources) > 1)
+               for source_id, uri in sources]
     
-    # 启动网页服务器
-    web_runner = await start_web_server()
+    stop_event = asyncio.Event()
     
-    client = HeartRateClient(uri)
+    def stop_all():
+        stop_event.set()
+        for client in clients:
+            client.stop()
     
     # 设置信号处理
     try:
         loop = asyncio.get_running_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
-            loop.add_signal_handler(sig, client.stop)
+            loop.add_signal_handler(sig, stop_all)
     except (NotImplementedError, OSError):
         pass
     
     try:
-        # 同时运行心跳客户端
-        await client.connect()
+        if replay_groups:
+            while not stop_event.is_set():
+                await replay(replay_groups, service.broadcast, args.speed, stop_event, log=log,
+                             hrv_window=service.filters['hrv_window'])
+                if not args.loop:
+                    break
+        else:
+            # 同时运行所有来源的心率客户端
+            await asyncio.gather(*(client.connect() for client in clients))
     except asyncio.CancelledError:
         pass
     finally:
         # 标记正在关闭，避免关闭时的日志输出
-        is_shutting_down = True
+        service.is_shutting_down = True
         
         # 取消心跳任务
-        if client.heartbeat_task and not client.heartbeat_task.done():
-            client.heartbeat_task.cancel()
-            try:
-                await client.heartbeat_task
-            except asyncio.CancelledError:
-                pass
-        
-        # 关闭所有网页客户端连接
-        for ws in list(connected_clients):
-            try:
-                await ws.close()
-            except Exception:
-                pass
-        connected_clients.clear()
+        for client in clients:
+            if client.heartbeat_task and not client.heartbeat_task.done():
+                client.heartbeat_task.cancel()
+                try:
+                    await client.heartbeat_task
+                except asyncio.CancelledError:
+                    pass
         
-        # 关闭网页服务器
-        try:
-            await web_runner.cleanup()
-        except Exception:
-            pass
+        # 写完录制缓冲区，关闭网页客户端连接和网页服务器
+        await service.close()
         
-        print("[*] 程序已退出")
+        log("[*] 程序已退出")
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        args = parse_args()
+        if args.analyze:
+            # 离线分析只读录制文件，不启动网页服务
+            analyze(args.analyze, analysis_options(args))
+        else:
+            asyncio.run(main(args))
     except KeyboardInterrupt:
-        print("\n[*] 强制退出")
+        log("\n[*] 强制退出")
     except Exception as e:
-        print(f"\n[错误] {e}")
\ No newline at end of file
+        log(f"\n[错误] {e}", ERROR)
+    finally:
+        log.close()
\ No newline at end of file